@@ -20,3 +20,4 @@ class ImageAdmin(admin.ModelAdmin):
 admin.site.register(CustomUser)
 admin.site.register(VerificationText)
 admin.site.register(JwtToken)
+admin.site.register(RevokedToken)
@@ -0,0 +1,58 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from django.urls import Resolver404, get_resolver
+
+
+class ThreadPoolASGIHandler(ASGIHandler):
+    """
+    Django runs every synchronous view of an ASGI worker on one shared thread,
+    so a single slow request blocks all the others. Requests whose viewset
+    action is listed in `async_actions` run on a dedicated thread pool
+    instead, which lets one worker serve many concurrent clients. Everything
+    else keeps the default behaviour.
+    """
+    THREAD_NAME_PREFIX = 'asgi-view'
+
+    def __init__(self, max_workers=None):
+        super().__init__()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.ASGI_VIEW_THREADS,
+            thread_name_prefix=self.THREAD_NAME_PREFIX
+        )
+        # ASGIHandler awaits get_response directly when it is a coroutine
+        self.get_response = self.get_response_async
+
+    def is_pooled(self, request):
+        try:
+            match = get_resolver().resolve(request.path_info)
+        except Resolver404:
+            return False
+        view_class = getattr(match.func, 'cls', None)
+        actions = getattr(match.func, 'actions', None) or {}
+        action = actions.get(request.method.lower())
+        return action is not None and \
+            action in getattr(view_class, 'async_actions', ())
+
+    async def get_response_async(self, request):
+        if self.is_pooled(request):
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self.executor, self.get_response_pooled, request)
+        return await sync_to_async(self.get_response_sync)(request)
+
+    def get_response_sync(self, request):
+        return super().get_response(request)
+
+    def get_response_pooled(self, request):
+        # request_finished fires on the event loop thread, so the connections
+        # of the pool threads are recycled here
+        close_old_connections()
+        try:
+            return self.get_response_sync(request)
+        finally:
+            close_old_connections()
@@ -1,9 +1,12 @@
 import jwt
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework_jwt.authentication import JSONWebTokenAuthentication, \
     jwt_decode_handler
 from rest_framework import exceptions
 
+from common.cache import token_cache, revocation_denylist
+
 
 class CustomTokenAuthentication(JSONWebTokenAuthentication):
     def authenticate(self, request):
@@ -42,15 +45,46 @@ class CustomTokenAuthentication(JSONWebTokenAuthentication):
             msg = 'Invalid payload.'
             raise exceptions.AuthenticationFailed(msg)
 
-        try:
-            user = CustomUser.objects.filter(
-                tokens__value=payload['token']).get()
-        except CustomUser.DoesNotExist:
-            msg = 'Invalid signature.'
-            raise exceptions.AuthenticationFailed(msg)
+        if settings.TOKEN_AUTH['MODE'] == 'stateless':
+            return self.authenticate_stateless(payload)
+
+        user = token_cache.get(payload['token'])
+        if user is None:
+            try:
+                user = CustomUser.objects.filter(
+                    tokens__value=payload['token']).get()
+            except CustomUser.DoesNotExist:
+                msg = 'Invalid signature.'
+                raise exceptions.AuthenticationFailed(msg)
+            token_cache.set(payload['token'], user)
 
         if not user.is_active:
             msg = 'User account is disabled.'
             raise exceptions.AuthenticationFailed(msg)
 
         return user
+
+    def authenticate_stateless(self, payload):
+        """
+        Trusts the signed payload instead of looking the token up. The user
+        only carries the claims of the token, other fields are deferred and
+        load from the database on first access.
+        """
+        CustomUser = get_user_model()
+        if 'user_id' not in payload:
+            msg = 'Invalid payload.'
+            raise exceptions.AuthenticationFailed(msg)
+
+        if revocation_denylist.is_revoked(payload['token']):
+            msg = 'Invalid signature.'
+            raise exceptions.AuthenticationFailed(msg)
+
+        claims = {
+            'id': payload['user_id'],
+            'email': payload.get('email'),
+            'is_active': True,
+        }
+        field_names = [field.attname for field in CustomUser._meta.concrete_fields
+                       if field.attname in claims]
+        return CustomUser.from_db(None, field_names,
+                                  [claims[name] for name in field_names])
@@ -0,0 +1,172 @@
+import copy
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class LRUCache(object):
+    """
+    Thread safe, size bounded in-process cache whose entries also expire
+    """
+
+    def __init__(self, max_size, timeout):
+        """
+        :param int max_size:
+        :param int timeout: seconds
+        """
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TokenCache(object):
+    """
+    Maps auth token values to a snapshot of their user so authenticated
+    requests do not query the database. Entries live in a local LRU and,
+    when `SHARED_CACHE` names a Django cache, in that cache too so a revoke
+    in one worker is seen by the others within `SHARED_LOCAL_TIMEOUT`.
+    """
+    KEY_PREFIX = 'auth-token:'
+
+    def __init__(self):
+        conf = settings.TOKEN_CACHE
+        self.timeout = conf['TIMEOUT']
+        self.shared_alias = conf['SHARED_CACHE']
+        local_timeout = conf['SHARED_LOCAL_TIMEOUT'] if self.shared_alias \
+            else conf['TIMEOUT']
+        self.local = LRUCache(conf['MAX_SIZE'], local_timeout)
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, token):
+        """
+        :param str token:
+        :rtype: common.models.CustomUser|None
+        """
+        user = self.local.get(token)
+        if user is None and self.shared is not None:
+            user = self.shared.get(self.KEY_PREFIX + token)
+            if user is not None:
+                self.local.set(token, user)
+        return copy.copy(user) if user is not None else None
+
+    def set(self, token, user):
+        self.local.set(token, user)
+        if self.shared is not None:
+            self.shared.set(self.KEY_PREFIX + token, user, self.timeout)
+
+    def invalidate(self, *tokens):
+        for token in tokens:
+            self.local.delete(token)
+        if self.shared is not None and tokens:
+            self.shared.delete_many([self.KEY_PREFIX + token for token in tokens])
+
+    def clear(self):
+        self.local.clear()
+
+
+token_cache = TokenCache()
+
+
+class RevocationDenylist(object):
+    """
+    In-memory set of revoked token values backing the stateless auth mode.
+    It is refreshed incrementally from the RevokedToken log when the shared
+    revocation version moves or every `REFRESH_INTERVAL` seconds, so
+    authentication itself never waits on the database otherwise.
+    """
+    VERSION_KEY = 'auth-revocation-version'
+
+    def __init__(self):
+        self.refresh_interval = settings.TOKEN_AUTH['DENYLIST_REFRESH_INTERVAL']
+        self.overlap = datetime.timedelta(seconds=settings.TOKEN_AUTH['DENYLIST_OVERLAP'])
+        self._values = {}
+        self._last_id = 0
+        self._version = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[settings.TOKEN_AUTH['DENYLIST_CACHE']]
+
+    def mark_changed(self):
+        try:
+            self.cache.incr(self.VERSION_KEY)
+        except ValueError:
+            self.cache.set(self.VERSION_KEY, 1, None)
+
+    def _is_stale(self, now):
+        if self._refreshed_at is None or \
+                now - self._refreshed_at > self.refresh_interval:
+            return True
+        return self.cache.get(self.VERSION_KEY) != self._version
+
+    def refresh(self):
+        from common.models import RevokedToken
+
+        with self._lock:
+            version = self.cache.get(self.VERSION_KEY)
+            now = datetime.datetime.now()
+            self._values = {value: expires_at
+                            for value, expires_at in self._values.items()
+                            if expires_at > now}
+            # revocations may commit out of id order, e.g. concurrent
+            # logouts, so the latest ones are read again on every refresh
+            since = now - self.overlap
+            for pk, value, expires_at in RevokedToken.get_active_after(self._last_id, since):
+                self._values[value] = expires_at
+                self._last_id = max(self._last_id, pk)
+            self._version = version
+            self._refreshed_at = time.monotonic()
+
+    def is_revoked(self, token):
+        if self._is_stale(time.monotonic()):
+            self.refresh()
+        return token in self._values
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+            self._last_id = 0
+            self._refreshed_at = None
+
+
+revocation_denylist = RevocationDenylist()
@@ -17,6 +17,12 @@ THE_REQUESTED_IS_FORBIDDEN_ACCESS = {
 }
 
 
+YOU_CANNOT_CREATE_THIS_OBJECT_AT_THIS_TIME = {
+    "status_code": 403,
+    "code": 403,
+    "message": "You cannot create this resource at this time"
+}
+
 YOU_CANNOT_UPDATE_THIS_OBJECT_AT_THIS_TIME = {
     "status_code": 403,
     "code": 403,
@@ -0,0 +1,40 @@
+from django.db import models
+
+from common.text import normalize_persian
+
+
+class NormalizedFieldMixin(object):
+    """
+    Copy of another text field of the model, normalized with
+    `normalize_persian` whenever the row is saved or bulk created, that
+    pagination filters and searches on instead of the original. Saves with
+    `update_fields` must list it next to its source field.
+    """
+
+    def __init__(self, source_field, *args, **kwargs):
+        """
+        :param str source_field: name of the normalized field
+        """
+        self.source_field = source_field
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('null', True)
+        kwargs.setdefault('blank', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source_field'] = self.source_field
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = normalize_persian(getattr(model_instance, self.source_field))
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class NormalizedCharField(NormalizedFieldMixin, models.CharField):
+    pass
+
+
+class NormalizedTextField(NormalizedFieldMixin, models.TextField):
+    pass
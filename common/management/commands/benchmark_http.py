@@ -0,0 +1,58 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Load tests a running server with many concurrent clients, run it ' \
+           'once against the WSGI server (e.g. gunicorn feedigi.wsgi) and ' \
+           'once against the ASGI one (e.g. uvicorn feedigi.asgi:application) ' \
+           'with the same arguments to compare them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url')
+        parser.add_argument('--token', help='JWT sent as a Bearer token')
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--timeout', type=int, default=60)
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = 'Bearer ' + options['token']
+
+        local = threading.local()
+        latencies, errors = [], []
+
+        def request(i):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            start = time.monotonic()
+            try:
+                response = local.session.get(options['url'], headers=headers,
+                                             timeout=options['timeout'])
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+            except requests.RequestException as e:
+                errors.append(e.__class__.__name__)
+            latencies.append(time.monotonic() - start)
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(request, range(options['requests'])))
+        elapsed = time.monotonic() - start
+
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write('Requests:    {}'.format(len(latencies)))
+        self.stdout.write('Errors:      {}'.format(len(errors)))
+        self.stdout.write('Concurrency: {}'.format(options['concurrency']))
+        self.stdout.write('Throughput:  {:.1f} req/s'.format(len(latencies) / elapsed))
+        self.stdout.write('Latency:     p50 {:.1f}ms, p95 {:.1f}ms, p99 {:.1f}ms'.format(
+            percentile(.5), percentile(.95), percentile(.99)))
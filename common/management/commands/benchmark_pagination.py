@@ -0,0 +1,45 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from common.models import PageNumberPagination, PaginationFilterable, PaginationPlan
+
+
+class Command(BaseCommand):
+    help = 'Times building the query set of a paginated request carrying one ' \
+           'filter and a growing number of other parameters, with the ' \
+           'compiled pagination plans reused and rebuilt on every request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default='feed.Source', help='app_label.Model')
+        parser.add_argument('--repeat', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        model = apps.get_model(options['model'])
+        for params_count in (0, 10, 100):
+            request = self.get_request(model, params_count)
+            cached = self.measure(model, request, options['repeat'], False)
+            cold = self.measure(model, request, options['repeat'], True)
+            self.stdout.write('{:>3} params: {:.1f}us compiled, {:.1f}us uncached'.format(
+                params_count, cached, cold))
+
+    def get_request(self, model, params_count):
+        params = {'page': 2, 'sort': '-id'}
+        if issubclass(model, PaginationFilterable) and model.get_filterable_fields():
+            params['filter__' + model.get_filterable_fields()[0]] = 'value'
+        for i in range(params_count):
+            params['param_{}'.format(i)] = 'value'
+        return Request(RequestFactory().get('/', params))
+
+    def measure(self, model, request, repeat, clear):
+        query_set = model.objects.all()
+        start = time.monotonic()
+        for i in range(repeat):
+            if clear:
+                PaginationPlan.clear()
+            PageNumberPagination(query_set, request,
+                                 count_strategy=PageNumberPagination.COUNT_NONE)
+        return (time.monotonic() - start) * 1000000 / repeat
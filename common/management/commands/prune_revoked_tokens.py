@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from common.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = 'Deletes revocation log entries of tokens that have expired anyway'
+
+    def handle(self, *args, **options):
+        deleted, _ = RevokedToken.prune()
+        self.stdout.write('Deleted {} revoked tokens'.format(deleted))
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='materialized_timeline',
+            field=models.BooleanField(default=False),
+        ),
+    ]
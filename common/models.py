@@ -1,6 +1,9 @@
+import base64
 import datetime
 
 import binascii
+import hashlib
+import json
 import random
 import string, os
 import uuid
@@ -13,12 +16,18 @@ from urllib.parse import urljoin
 import math
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
 from django.core.files.storage import FileSystemStorage
-from django.db import models
+from django.db import connections, models
 from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import gettext_lazy as _
 
 from common import const
+from common.cache import token_cache, revocation_denylist
+from common.fields import NormalizedFieldMixin
+from common.text import normalize_persian
 from feedigi import settings
 
 
@@ -74,8 +83,181 @@ class PaginationSearchable:
     def get_searchable_fields(cls):
         return []
 
+    @classmethod
+    def get_search_index(cls):
+        """
+        Full text index used for `search` instead of `icontains` lookups
+        :rtype: common.search.FullTextIndex|None
+        """
+        return None
+
+
+def get_count_cache_version(model):
+    return cache.get_or_set(
+        'pagination-count-version:{}'.format(model._meta.label_lower), 1, None)
+
+
+def invalidate_count_cache(model):
+    """
+    Drops every cached pagination count of the model, call it after writes
+    that bypass the model signals such as bulk_create and update
+    """
+    key = 'pagination-count-version:{}'.format(model._meta.label_lower)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def _invalidate_count_cache_receiver(sender, **kwargs):
+    invalidate_count_cache(sender)
+
+
+def track_count_cache(*models, deletes=True):
+    """
+    Invalidates the cached pagination counts of the models on every save and
+    delete. Only connect paginated models, a delete receiver turns off the
+    fast delete of the model and of every cascade into it and runs once per
+    deleted row.
+    :param bool deletes: false for large tables, whose deleting code paths
+        call invalidate_count_cache once themselves
+    """
+    for model in models:
+        post_save.connect(_invalidate_count_cache_receiver, sender=model,
+                          dispatch_uid='invalidate_count_cache_on_save')
+        if deletes:
+            post_delete.connect(_invalidate_count_cache_receiver, sender=model,
+                                dispatch_uid='invalidate_count_cache_on_delete')
+
+
+class PaginationPlan(object):
+    """
+    Everything pagination derives from a model and the fields a view
+    exposes, worked out once per combination: the lookup and value converter
+    of every filter parameter, the accepted sort expressions and the search
+    lookups. Requests then only do dictionary lookups.
+    """
+    _plans = {}
+
+    def __init__(self, model, filterable_fields, sortable_fields, search_fields,
+                 key_map):
+        """
+        :param type model:
+        :param tuple filterable_fields:
+        :param tuple sortable_fields:
+        :param tuple search_fields:
+        :param tuple key_map: (parameter prefix, lookup suffix) pairs
+        """
+        self.model = model
+        self._fields = {}
+
+        self.filters = {}
+        for name in filterable_fields:
+            lookup = self.get_normalized_lookup(name)
+            converter = self.get_converter(self.get_field(name))
+            for prefix, suffix in key_map:
+                self.filters[prefix + name] = (lookup + suffix, converter)
+
+        self.sorts = frozenset(
+            sign + name for name in sortable_fields for sign in ('', '-', '+'))
+
+        self.search_lookups = [
+            ('{}__icontains'.format(self.get_normalized_lookup(name)),
+             self.get_converter(self.get_field(name)))
+            for name in search_fields
+        ]
+        self.search_index = model.get_search_index() \
+            if issubclass(model, PaginationSearchable) else None
+
+    @classmethod
+    def get(cls, model, filterable_fields, sortable_fields, search_fields, key_map):
+        key = (model, tuple(filterable_fields), tuple(sortable_fields),
+               tuple(search_fields), tuple(key_map.items()))
+        plan = cls._plans.get(key)
+        if plan is None:
+            plan = cls._plans[key] = cls(*key)
+        return plan
+
+    @classmethod
+    def clear(cls):
+        cls._plans = {}
+
+    def get_field(self, key):
+        """
+        Model field of a lookup that may follow relations
+        :param str key:
+        """
+        field = self._fields.get(key)
+        if field is None:
+            model = self.model
+            names = key.split('__')
+            for name in names[:-1]:
+                model = model._meta.get_field(name).related_model
+            field = self._fields[key] = model._meta.get_field(names[-1])
+        return field
+
+    def get_normalized_lookup(self, key):
+        """
+        Points text fields that have a normalized copy to the copy
+        """
+        field = self.get_field(key)
+        prefix, _, name = key.rpartition('__')
+        for candidate in field.model._meta.concrete_fields:
+            if isinstance(candidate, NormalizedFieldMixin) and \
+                    candidate.source_field == name:
+                return '{}__{}'.format(prefix, candidate.name) if prefix \
+                    else candidate.name
+        return key
+
+    @staticmethod
+    def get_converter(field):
+        if isinstance(field, (models.CharField, models.TextField)):
+            return _to_text
+        if isinstance(field, models.BooleanField):
+            return _to_bool
+        if isinstance(field, (models.IntegerField, models.BigIntegerField,
+                              models.BigAutoField)):
+            return _to_int
+        if isinstance(field, (models.FloatField, models.DecimalField)):
+            return _to_float
+        return _to_raw
+
+
+def _to_text(value):
+    return normalize_persian(str(value))
+
+
+def _to_bool(value):
+    return not (value.lower() == "false" or value == "0")
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def _to_raw(value):
+    return value
+
 
 class PageNumberPagination(object):
+    COUNT_EXACT = 'exact'
+    COUNT_CACHED = 'cached'
+    COUNT_APPROXIMATE = 'approximate'
+    COUNT_NONE = 'none'
+
+    # estimates below this many rows are replaced with an exact count
+    APPROXIMATE_COUNT_THRESHOLD = 1000
+
     FILTERABLE_KEY_MAP = {
         "filter__": "__icontains",
         "exact__": "",
@@ -87,13 +269,16 @@ class PageNumberPagination(object):
 
     def __init__(self, query_set, request, page_size=20, filterable_fields=None,
                  sortable_fields=None,
-                 search_fields=None):
+                 search_fields=None, count_strategy=COUNT_EXACT,
+                 count_cache_timeout=60):
         """
         :param django.db.models.QuerySet query_set:
         :param rest_framework.request.Request request:
         :param int page_size:
         :param list filterable_fields:
         :param list sortable_fields:
+        :param str count_strategy: one of the COUNT_* constants
+        :param int count_cache_timeout: seconds, for COUNT_CACHED
         """
 
         self.filterable_fields = filterable_fields
@@ -111,8 +296,61 @@ class PageNumberPagination(object):
         self.search_text = self._request.query_params.get('search', None)
         self.query_set = query_set
         self._update_query_set()
-        self.total_count = self.query_set.count()
-        self.page_count = int(math.ceil(self.total_count / self.page_size))
+
+        self.count_strategy = count_strategy
+        self.count_cache_timeout = count_cache_timeout
+        self._has_next = None
+        self.total_count = self._count()
+        if self.total_count is None:
+            self.page_count = None
+        else:
+            self.page_count = int(math.ceil(self.total_count / self.page_size))
+
+    def _count(self):
+        if self.count_strategy == self.COUNT_NONE:
+            return None
+        if self.count_strategy == self.COUNT_CACHED:
+            return self._cached_count()
+        if self.count_strategy == self.COUNT_APPROXIMATE:
+            return self._approximate_count()
+        return self.query_set.count()
+
+    def _cached_count(self):
+        try:
+            sql, params = self.query_set.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        signature = hashlib.md5('{}{}'.format(sql, params).encode()).hexdigest()
+        key = 'pagination-count:{}:{}:{}:{}'.format(
+            self.query_set.model._meta.label_lower,
+            get_count_cache_version(self.query_set.model),
+            getattr(self._request.user, 'pk', None),
+            signature
+        )
+        return cache.get_or_set(key, self.query_set.count,
+                                self.count_cache_timeout)
+
+    def _approximate_count(self):
+        """
+        Uses the planner estimate where the database keeps statistics and
+        falls back to an exact count everywhere else
+        """
+        connection = connections[self.query_set.db]
+        if connection.vendor != 'postgresql':
+            return self.query_set.count()
+        try:
+            sql, params = self.query_set.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) {}'.format(sql), params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate < self.APPROXIMATE_COUNT_THRESHOLD:
+            return self.query_set.count()
+        return estimate
 
     def _update_query_set(self):
         if self.filterable_fields is None and issubclass(self.query_set.model,
@@ -136,15 +374,26 @@ class PageNumberPagination(object):
         if self.search_fields is None:
             self.search_fields = []
 
+        self.plan = PaginationPlan.get(self.query_set.model, self.filterable_fields,
+                                       self.sortable_fields, self.search_fields,
+                                       self.FILTERABLE_KEY_MAP)
+
         for value in self._get_filter_kwargs_list():
             self.query_set = self.query_set.filter(**value)
 
-        if self.search_text:
+        search_index = self.plan.search_index
+        if self.search_text and search_index and \
+                search_index.is_available(self.query_set.db):
+            self.query_set = search_index.search(
+                self.query_set, self._arabic_to_persian(self.search_text))
+            if search_index.RANK_ANNOTATION in self.query_set.query.annotations and \
+                    not self._request.query_params.get('sort'):
+                self.query_set = self.query_set.order_by(
+                    '-{}'.format(search_index.RANK_ANNOTATION), '-id')
+        elif self.search_text:
             or_query = None
-            for field in self.search_fields:
-                q = Q(**{'{}__icontains'.format(field):
-                             self._get_value(field, self.search_text)}
-                      )
+            for lookup, converter in self.plan.search_lookups:
+                q = Q(**{lookup: converter(self.search_text)})
                 if or_query:
                     or_query = or_query | q
                 else:
@@ -152,106 +401,53 @@ class PageNumberPagination(object):
             if or_query:
                 self.query_set = self.query_set.filter(or_query)
 
-        for value in self._get_sort_list():
-            self.query_set = self.query_set.order_by(value)
+        sort_list = list(self._get_sort_list())
+        if sort_list:
+            self.query_set = self.query_set.order_by(*sort_list)
 
     def _get_filter_kwargs_list(self):
+        filters = self.plan.filters
         for key, value in self._request.query_params.items():
-            for k, v in self.FILTERABLE_KEY_MAP.items():
-                if key.startswith(k):
-                    new_key = key.replace(k, "", 1)
-                    if new_key in self.filterable_fields:
-                        yield {
-                            "{}{}".format(new_key, v): self._get_value(new_key,
-                                                                       value)
-                        }
-
-    def _get_value(self, key, value, model=None):
-
-        meta = model._meta if model else self.query_set.model._meta
-        split_ket = key.split('__', 1)
-        if len(split_ket) > 1:
-            model = meta.get_field(split_ket[0]).related_model
-            return self._get_value(split_ket[1], value, model)
-
-        field = meta.get_field(key)
-
-        if value == 'null':
-            return None
-
-        if isinstance(field, (models.CharField, models.TextField)):
-            return self._arabic_to_persian(str(value))
-
-        if isinstance(field, models.BooleanField):
-            if value.lower() == "false" or value == "0":
-                return False
-            return True
-
-        if isinstance(field, (
-                models.IntegerField, models.BigIntegerField,
-                models.BigAutoField)):
-            try:
-                return int(value)
-            except ValueError as e:
-                return 0
-
-        if isinstance(field, (models.FloatField, models.DecimalField)):
-            try:
-                return float(value)
-            except ValueError as e:
-                return 0.0
-
-        return value
+            compiled = filters.get(key)
+            if compiled is not None:
+                lookup, converter = compiled
+                yield {lookup: None if value == 'null' else converter(value)}
 
     def _arabic_to_persian(self, word):
-        characters = {
-            'ك': 'ک',
-            'دِ': 'د',
-            'بِ': 'ب',
-            'زِ': 'ز',
-            'ذِ': 'ذ',
-            'شِ': 'ش',
-            'سِ': 'س',
-            'ى': 'ی',
-            'ي': 'ی',
-            '١': '۱',
-            '٢': '۲',
-            '٣': '۳',
-            '٤': '۴',
-            '٥': '۵',
-            '٦': '۶',
-            '٧': '۷',
-            '٨': '۸',
-            '٩': '۹',
-            '٠': '۰',
-        }
-        for k, v in characters.items():
-            word = word.replace(k, v)
-        return word
+        return normalize_persian(word)
 
     def _get_sort_list(self):
-        sort_field = []
-
         request_sort = self._request.query_params.get('sort')
         if not request_sort:
-            return sort_field
+            return
 
         for item in request_sort.split(","):
-            if item.replace("-", "", 1).replace("+", "",
-                                                1) in self.sortable_fields:
+            if item in self.plan.sorts:
                 yield item
 
     def get_result(self):
-        return self.query_set[(
-                                      self.current_page - 1) * self.page_size:self.page_size * self.current_page]
+        start = (self.current_page - 1) * self.page_size
+        if self.total_count is not None:
+            return self.query_set[start:self.page_size * self.current_page]
+
+        # without a count, one extra row tells whether there is a next page
+        result = list(self.query_set[start:start + self.page_size + 1])
+        self._has_next = len(result) > self.page_size
+        return result[:self.page_size]
 
     def get_total_count(self):
         return self.total_count
 
     def get_last_page(self):
+        if self.page_count is None:
+            return None
         return self.page_count if self.page_count > 0 else 1
 
     def has_next_page(self):
+        if self.page_count is None:
+            if self._has_next is None:
+                self.get_result()
+            return self._has_next
         return self.current_page < self.get_last_page()
 
     def has_prev_page(self):
@@ -269,7 +465,7 @@ class PageNumberPagination(object):
         return 1
 
     def get_pagination_headers(self):
-        return {
+        headers = {
             "X-Pagination-Total-Count": self.get_total_count(),
             "X-Pagination-Page-Count": self.get_last_page(),
             "X-Pagination-Current-Page": self.current_page,
@@ -279,6 +475,10 @@ class PageNumberPagination(object):
             "X-Pagination-Searchable-Fields": ",".join(self.search_fields),
             "Link": self.get_links()
         }
+        if self.total_count is None:
+            del headers["X-Pagination-Total-Count"]
+            del headers["X-Pagination-Page-Count"]
+        return headers
 
     def get_links(self):
 
@@ -320,14 +520,187 @@ class PageNumberPagination(object):
                 "rel": "next",
             })
 
-        links.append({
-            "page_number": self.get_last_page(),
-            "rel": "last",
-        })
+        if self.get_last_page() is not None:
+            links.append({
+                "page_number": self.get_last_page(),
+                "rel": "last",
+            })
 
         return ", ".join([get_link(link) for link in links])
 
 
+class CursorPagination(PageNumberPagination):
+    """
+    Keyset pagination, pages on the values of the ordering fields of the last
+    returned row instead of an OFFSET and never counts the query set.
+    Nullable fields can not be compared and are ignored as sort fields.
+    """
+    CURSOR_PARAM = 'cursor'
+
+    def __init__(self, query_set, request, page_size=20, ordering=None,
+                 filterable_fields=None, sortable_fields=None,
+                 search_fields=None):
+        """
+        :param django.db.models.QuerySet query_set:
+        :param rest_framework.request.Request request:
+        :param int page_size:
+        :param list ordering: default ordering, `-id` is always appended
+        :param list filterable_fields:
+        :param list sortable_fields:
+        :param list search_fields:
+        """
+        self.filterable_fields = filterable_fields
+        self.sortable_fields = sortable_fields
+        self.search_fields = search_fields
+        self._request = request
+        try:
+            self.page_size = int(
+                self._request.query_params.get('page_size', page_size))
+        except ValueError as e:
+            self.page_size = page_size
+
+        self.search_text = self._request.query_params.get('search', None)
+        self.query_set = query_set
+        self._update_query_set()
+
+        self.ordering = self._get_ordering(ordering or ['-id'])
+        self.values, self.is_reversed = self._decode_cursor(
+            self._request.query_params.get(self.CURSOR_PARAM))
+
+        self.has_more = False
+        self._result = None
+
+    def _get_ordering(self, default):
+        ordering = []
+        for item in list(self._get_sort_list()) + list(default) + ['-id']:
+            name = item.lstrip('+-')
+            if name == 'pk':
+                name = 'id'
+            if name in [field for field, desc in ordering]:
+                continue
+            if self._get_field(name).null:
+                continue
+            ordering.append((name, item.startswith('-')))
+        return ordering
+
+    def _get_field(self, key):
+        if key in self.query_set.query.annotations:
+            return self.query_set.query.annotations[key].output_field
+        return self.plan.get_field(key)
+
+    def _decode_cursor(self, cursor):
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            if len(data['v']) != len(self.ordering):
+                return None, False
+            values = [
+                self._get_field(name).to_python(value)
+                for (name, desc), value in zip(self.ordering, data['v'])
+            ]
+            return values, bool(data.get('r'))
+        except (ValueError, TypeError, KeyError, ValidationError):
+            return None, False
+
+    def _encode_cursor(self, obj, is_reversed):
+        values = []
+        for name, desc in self.ordering:
+            value = obj
+            for attribute in name.split('__'):
+                value = getattr(value, attribute)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        data = json.dumps({'v': values, 'r': 1 if is_reversed else 0}, default=str)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def _get_keyset_filter(self):
+        query = None
+        for i, (name, desc) in enumerate(self.ordering):
+            lookup = 'lt' if desc != self.is_reversed else 'gt'
+            q = Q(**{'{}__{}'.format(name, lookup): self.values[i]})
+            for previous, value in zip(self.ordering[:i], self.values):
+                q &= Q(**{previous[0]: value})
+            query = q if query is None else query | q
+        return query
+
+    def get_result(self):
+        if self._result is not None:
+            return self._result
+
+        query_set = self.query_set
+        if self.values is not None:
+            query_set = query_set.filter(self._get_keyset_filter())
+        query_set = query_set.order_by(*[
+            '{}{}'.format('-' if desc != self.is_reversed else '', name)
+            for name, desc in self.ordering
+        ])
+
+        result = list(query_set[:self.page_size + 1])
+        self.has_more = len(result) > self.page_size
+        result = result[:self.page_size]
+        if self.is_reversed:
+            result.reverse()
+        self._result = result
+        return result
+
+    def has_next_page(self):
+        self.get_result()
+        return self.is_reversed or self.has_more
+
+    def has_prev_page(self):
+        self.get_result()
+        if self.is_reversed:
+            return self.has_more
+        return self.values is not None
+
+    def get_next_cursor(self):
+        if self.has_next_page() and self._result:
+            return self._encode_cursor(self._result[-1], False)
+
+    def get_prev_cursor(self):
+        if self.has_prev_page() and self._result:
+            return self._encode_cursor(self._result[0], True)
+
+    def get_pagination_headers(self):
+        return {
+            "X-Pagination-Per-Page": self.page_size,
+            "X-Pagination-Sortable-Fields": ",".join(self.sortable_fields),
+            "X-Pagination-Filterable-Fields": ",".join(self.filterable_fields),
+            "X-Pagination-Searchable-Fields": ",".join(self.search_fields),
+            "Link": self.get_links()
+        }
+
+    def get_links(self):
+        url = "{0}://{1}{2}".format(
+            self._request.scheme,
+            self._request.get_host(),
+            self._request.path,
+        )
+
+        def get_link(cursor, rel):
+            query_params = copy.copy(self._request.query_params)
+            query_params._mutable = True
+            query_params.pop('page', None)
+            query_params[self.CURSOR_PARAM] = cursor
+            return "<{rout}?{query_params}>; rel={rel}".format(
+                rout=url,
+                query_params=query_params.urlencode(safe="/"),
+                rel=rel
+            )
+
+        links = [get_link('', 'first')]
+
+        prev_cursor = self.get_prev_cursor()
+        if prev_cursor:
+            links.append(get_link(prev_cursor, 'prev'))
+
+        next_cursor = self.get_next_cursor()
+        if next_cursor:
+            links.append(get_link(next_cursor, 'next'))
+
+        return ", ".join(links)
+
+
 ##########################################################################################
 # DataBase Models
 ##########################################################################################
@@ -387,6 +760,10 @@ class CustomUser(AbstractUser):
     email_verification_code = models.CharField(max_length=255, null=True, blank=True)
     password_verification_code = models.CharField(max_length=255, null=True, blank=True)
 
+    # Fan out new posts into feed.TimelineEntry rows instead of sorting the
+    # posts of every followed source when the timeline is read
+    materialized_timeline = models.BooleanField(default=False)
+
     EMAIL_FIELD = 'email'
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
@@ -410,6 +787,15 @@ class CustomUser(AbstractUser):
     def get_with_email(cls, email):
         return cls.objects.filter(email=email).first()
 
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        if self.pk and not self.is_active:
+            # deleting the tokens also logs them as revoked
+            self.tokens.all().delete()
+        elif self.pk:
+            token_cache.invalidate(*self.tokens.values_list('value', flat=True))
+        return result
+
     def update_last_login(self):
         self.last_login = datetime.datetime.now()
         self.save()
@@ -485,6 +871,51 @@ class JwtToken(BaseModel):
         return cls.objects.filter(value=payload['token']).delete()
 
 
+class RevokedToken(BaseModel):
+    """
+    Append-only log of deleted JwtToken values, read incrementally by the
+    stateless authentication denylist
+    """
+    value = models.CharField(max_length=255)
+    expires_at = models.DateTimeField(db_index=True)
+
+    @classmethod
+    def get_active_after(cls, last_id, since=None):
+        """
+        Unexpired revocations past `last_id`, and also those created since
+        `since` so rows committed out of id order are not missed
+        :param int last_id:
+        :param datetime.datetime since:
+        """
+        query = Q(id__gt=last_id)
+        if since is not None:
+            query |= Q(created_at__gte=since)
+        return cls.objects.filter(
+            query,
+            expires_at__gt=datetime.datetime.now()
+        ).order_by('id').values_list('id', 'value', 'expires_at')
+
+    @classmethod
+    def prune(cls):
+        return cls.objects.filter(expires_at__lte=datetime.datetime.now()).delete()
+
+
+def _revoke_token_receiver(sender, instance, **kwargs):
+    token_cache.invalidate(instance.value)
+    RevokedToken.objects.create(
+        value=instance.value,
+        expires_at=(instance.created_at or datetime.datetime.now()) + max(
+            settings.JWT_AUTH['JWT_EXPIRATION_DELTA'],
+            settings.JWT_AUTH['JWT_REFRESH_EXPIRATION_DELTA']
+        )
+    )
+    revocation_denylist.mark_changed()
+
+
+post_delete.connect(_revoke_token_receiver, sender=JwtToken,
+                    dispatch_uid='revoke_token_on_delete')
+
+
 class Image(BaseModel):
     key = models.CharField(_('Key'), max_length=127, null=True, blank=True)
     uri = models.CharField(_('Uri'), max_length=255, null=True, blank=True)
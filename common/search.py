@@ -0,0 +1,152 @@
+import logging
+
+from django.db import DatabaseError, connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+
+class FullTextIndex(object):
+    """
+    Full text index of some text columns of a table. SQLite keeps it in an
+    external content FTS5 table maintained by triggers, PostgreSQL in a GIN
+    index on the tsvector of the columns. Both are filled by the database
+    itself on every insert, bulk inserts included. Callers fall back to
+    `icontains` lookups when `is_available` is false, e.g. on other databases
+    or an SQLite built without FTS5.
+    """
+    POSTGRES_CONFIG = 'simple'
+    SQLITE_TOKENIZER = 'unicode61 remove_diacritics 2'
+    RANK_ANNOTATION = 'search_rank'
+
+    def __init__(self, table, fields, pk='id'):
+        """
+        :param str table: db table of the model
+        :param list[str] fields: text columns
+        :param str pk: primary key column
+        """
+        self.table = table
+        self.fields = fields
+        self.pk = pk
+        self._available = set()
+
+    @property
+    def fts_table(self):
+        return '{}_fts'.format(self.table)
+
+    @property
+    def gin_index(self):
+        return '{}_search_idx'.format(self.table)
+
+    def get_tsvector(self, table=None):
+        prefix = '"{}".'.format(table) if table else ''
+        document = " || ' ' || ".join(
+            "coalesce({}\"{}\", '')".format(prefix, field) for field in self.fields)
+        return "to_tsvector('{}', {})".format(self.POSTGRES_CONFIG, document)
+
+    def install(self, connection, create=True):
+        """
+        Creates the index if it is missing, safe to run repeatedly. SQLite
+        drops the triggers whenever a migration rebuilds the table, running
+        it after migrate puts them back.
+        :param bool create: only repair an existing index when false
+        """
+        if connection.vendor == 'postgresql' and create:
+            with connection.cursor() as cursor:
+                cursor.execute('CREATE INDEX IF NOT EXISTS "{}" ON "{}" USING GIN (({}))'.format(
+                    self.gin_index, self.table, self.get_tsvector()))
+        elif connection.vendor == 'sqlite':
+            self._install_sqlite(connection, create)
+
+    def _install_sqlite(self, connection, create):
+        columns = ', '.join('"{}"'.format(field) for field in self.fields)
+        new_values = ', '.join('new."{}"'.format(field) for field in self.fields)
+        old_values = ', '.join('old."{}"'.format(field) for field in self.fields)
+        exists = self.fts_table in connection.introspection.table_names()
+        if not exists and not create:
+            return
+        statements = [
+            'CREATE TRIGGER IF NOT EXISTS "{fts}_ai" AFTER INSERT ON "{table}" BEGIN '
+            'INSERT INTO "{fts}" (rowid, {columns}) VALUES (new."{pk}", {new}); END',
+            'CREATE TRIGGER IF NOT EXISTS "{fts}_ad" AFTER DELETE ON "{table}" BEGIN '
+            'INSERT INTO "{fts}" ("{fts}", rowid, {columns}) '
+            'VALUES (\'delete\', old."{pk}", {old}); END',
+            'CREATE TRIGGER IF NOT EXISTS "{fts}_au" AFTER UPDATE ON "{table}" BEGIN '
+            'INSERT INTO "{fts}" ("{fts}", rowid, {columns}) '
+            'VALUES (\'delete\', old."{pk}", {old}); '
+            'INSERT INTO "{fts}" (rowid, {columns}) VALUES (new."{pk}", {new}); END',
+        ]
+        if not exists:
+            statements = [
+                'CREATE VIRTUAL TABLE "{fts}" USING fts5({columns}, content="{table}", '
+                'content_rowid="{pk}", tokenize="{tokenizer}")',
+                'INSERT INTO "{fts}" ("{fts}") VALUES (\'rebuild\')',
+            ] + statements
+        try:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement.format(
+                        fts=self.fts_table, table=self.table, pk=self.pk,
+                        columns=columns, new=new_values, old=old_values,
+                        tokenizer=self.SQLITE_TOKENIZER))
+        except DatabaseError as e:
+            # SQLite may be built without FTS5
+            logger.warning('Full text index %s is not installed: %s', self.fts_table, e)
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('DROP INDEX IF EXISTS "{}"'.format(self.gin_index))
+            elif connection.vendor == 'sqlite':
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute('DROP TRIGGER IF EXISTS "{}_{}"'.format(self.fts_table, suffix))
+                cursor.execute('DROP TABLE IF EXISTS "{}"'.format(self.fts_table))
+
+    def is_available(self, using):
+        if using in self._available:
+            return True
+        connection = connections[using]
+        if connection.vendor == 'postgresql' or (
+                connection.vendor == 'sqlite' and
+                self.fts_table in connection.introspection.table_names()):
+            self._available.add(using)
+            return True
+        return False
+
+    def search(self, query_set, text):
+        """
+        Filters the query set on the text and annotates each row with a
+        relevance as `search_rank`, higher is better
+        :param django.db.models.QuerySet query_set:
+        :param str text:
+        :rtype: django.db.models.QuerySet
+        """
+        words = text.split()
+        if not words:
+            return query_set
+        if connections[query_set.db].vendor == 'postgresql':
+            return self.search_postgresql(query_set, text)
+        return self.search_sqlite(query_set, words)
+
+    def search_sqlite(self, query_set, words):
+        # every word is quoted so user input can not use the FTS5 syntax, and
+        # matched as a prefix like icontains did
+        match = ' '.join('"{}" *'.format(word.replace('"', '""')) for word in words)
+        matches = 'SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s'.format(fts=self.fts_table)
+        rank = 'SELECT -rank FROM "{fts}" WHERE "{fts}" MATCH %s AND rowid = "{table}"."{pk}"'.format(
+            fts=self.fts_table, table=self.table, pk=self.pk)
+        return query_set.filter(
+            pk__in=RawSQL(matches, (match,))
+        ).annotate(**{
+            self.RANK_ANNOTATION: RawSQL(rank, (match,), output_field=FloatField())
+        })
+
+    def search_postgresql(self, query_set, text):
+        # the expression matches the one of the GIN index
+        tsvector = self.get_tsvector(self.table)
+        tsquery = "plainto_tsquery('{}', %s)".format(self.POSTGRES_CONFIG)
+        return query_set.annotate(**{
+            self.RANK_ANNOTATION: RawSQL('ts_rank({}, {})'.format(tsvector, tsquery),
+                                        (text,), output_field=FloatField())
+        }).extra(where=['{} @@ {}'.format(tsvector, tsquery)], params=[text])
@@ -1,4 +1,7 @@
-from rest_framework.serializers import Serializer, ModelSerializer
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import Serializer, ModelSerializer, \
+    ListSerializer
 
 
 class BaseSerializer(Serializer):
@@ -11,3 +14,45 @@ class BaseSerializer(Serializer):
 
 class BaseModelSerializer(ModelSerializer):
     pass
+
+
+def get_eager_loading(serializer_class, model=None, prefix='', many=False):
+    """
+    Walks the nested serializers of a model serializer and returns the
+    relations it reads as (select_related, prefetch_related) lookups
+    :param type serializer_class:
+    :rtype: (list, list)
+    """
+    serializer = serializer_class()
+    model = model or serializer.Meta.model
+    select_related, prefetch_related = [], []
+
+    for field in serializer.fields.values():
+        if field.write_only or not field.source or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+
+        lookup = prefix + field.source
+        related_many = many or model_field.many_to_many or model_field.one_to_many
+        if isinstance(field, ListSerializer):
+            child = field.child.__class__
+        elif isinstance(field, ModelSerializer):
+            child = field.__class__
+        elif isinstance(field, ManyRelatedField):
+            prefetch_related.append(lookup)
+            continue
+        else:
+            continue
+
+        (prefetch_related if related_many else select_related).append(lookup)
+        nested_select, nested_prefetch = get_eager_loading(
+            child, model_field.related_model, lookup + '__', related_many)
+        select_related.extend(nested_select)
+        prefetch_related.extend(nested_prefetch)
+
+    return select_related, prefetch_related
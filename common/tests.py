@@ -0,0 +1,27 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountTestMixin:
+    """
+    Asserts an endpoint runs the same number of queries whatever the page
+    size, which is what an N+1 regression breaks
+    """
+
+    def get_query_counts(self, url, page_sizes, **params):
+        # warm up per process caches such as the auth token cache
+        self.client.get(url, params)
+        counts = {}
+        for page_size in page_sizes:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, dict(params, page_size=page_size))
+            self.assertEqual(200, response.status_code)
+            counts[page_size] = len(queries)
+        return counts
+
+    def assertConstantQueries(self, url, page_sizes=(1, 5, 20), num=None, **params):
+        counts = self.get_query_counts(url, page_sizes, **params)
+        self.assertEqual(1, len(set(counts.values())),
+                         'Query count depends on page size: {}'.format(counts))
+        if num is not None:
+            self.assertEqual(num, list(counts.values())[0])
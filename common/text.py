@@ -0,0 +1,28 @@
+# Arabic forms of Persian letters and digits, and the kasra which is left
+# out of searches, mapped in one table so text is normalized in one pass
+PERSIAN_TRANSLATION = str.maketrans({
+    'ك': 'ک',
+    'ى': 'ی',
+    'ي': 'ی',
+    'ِ': None,
+    '١': '۱',
+    '٢': '۲',
+    '٣': '۳',
+    '٤': '۴',
+    '٥': '۵',
+    '٦': '۶',
+    '٧': '۷',
+    '٨': '۸',
+    '٩': '۹',
+    '٠': '۰',
+})
+
+
+def normalize_persian(text):
+    """
+    :param str|None text:
+    :rtype: str|None
+    """
+    if text is None:
+        return None
+    return text.translate(PERSIAN_TRANSLATION)
@@ -1,10 +1,12 @@
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 from rest_framework.views import APIView
 from rest_framework.viewsets import ViewSetMixin
 
 from common import errors
-from common.models import PageNumberPagination
+from common.models import PageNumberPagination, CursorPagination
 from common.response import Response, ErrorResponse
+from common.serializers import get_eager_loading
 
 
 class BaseApiView(APIView):
@@ -16,6 +18,14 @@ class BaseViewSet(ViewSetMixin, BaseApiView):
     serializer_class = None
     single_serializer_class = None
     url_params = []
+    # name -> (url param, model or queryset, lookup of the owning user), the
+    # objects are loaded once per request into `request.url_objects` and the
+    # serializer context
+    url_objects = {}
+    # (select_related, prefetch_related), derived from serializer_class if None
+    eager_loading = None
+    # actions the ASGI handler may run concurrently on its thread pool
+    async_actions = ()
 
     @property
     def _single_serializer_class(self):
@@ -31,8 +41,28 @@ class BaseViewSet(ViewSetMixin, BaseApiView):
     def get_queryset(self, request):
         return self.queryset
 
+    @classmethod
+    def get_eager_loading(cls, serializer_class):
+        if cls.eager_loading is not None:
+            return cls.eager_loading
+        cache = cls.__dict__.get('_eager_loading_cache')
+        if cache is None:
+            cache = cls._eager_loading_cache = {}
+        if serializer_class not in cache:
+            cache[serializer_class] = get_eager_loading(serializer_class)
+        return cache[serializer_class]
+
+    def optimize_queryset(self, query_set, serializer_class=None):
+        select_related, prefetch_related = self.get_eager_loading(
+            serializer_class or self.serializer_class)
+        if select_related:
+            query_set = query_set.select_related(*select_related)
+        if prefetch_related:
+            query_set = query_set.prefetch_related(*prefetch_related)
+        return query_set
+
     def list(self, request):
-        objects = self.get_queryset(request).all()
+        objects = self.optimize_queryset(self.get_queryset(request)).all()
         return Response(data=self.serializer_class(
             objects,
             many=True,
@@ -49,7 +79,8 @@ class BaseViewSet(ViewSetMixin, BaseApiView):
         return Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
     def retrieve(self, request, pk):
-        obj = self.get_queryset(request).filter(pk=pk).first()
+        obj = self.optimize_queryset(self.get_queryset(request),
+                                     self._single_serializer_class).filter(pk=pk).first()
         if not obj:
             return self.not_found(request)
 
@@ -92,6 +123,23 @@ class BaseViewSet(ViewSetMixin, BaseApiView):
         request.url_params = url_params
         return super().dispatch(request, *args, **kwargs)
 
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        request.url_objects = self.resolve_url_objects(request)
+
+    def resolve_url_objects(self, request):
+        objects = {}
+        for name, (param, model, user_lookup) in self.url_objects.items():
+            query_set = model.all() if hasattr(model, 'all') else model.objects.all()
+            if user_lookup:
+                query_set = query_set.filter(**{user_lookup: request.user})
+            obj = query_set.filter(pk=request.url_params.get(param)).first()
+            if not obj:
+                raise NotFound('The requested {} is not found'.format(
+                    query_set.model._meta.verbose_name))
+            objects[name] = obj
+        return objects
+
     def create_default_params(self, request):
         return {}
 
@@ -100,6 +148,7 @@ class BaseViewSet(ViewSetMixin, BaseApiView):
 
     def get_context(self, request):
         context = {'request': request}
+        context.update(getattr(request, 'url_objects', {}))
         context.update(self.additional_context_params(request))
         return context
 
@@ -115,11 +164,30 @@ class BaseViewSet(ViewSetMixin, BaseApiView):
 
 
 class PaginatedViewSet(BaseViewSet):
+    PAGINATION_MODE_PAGE = 'page'
+    PAGINATION_MODE_CURSOR = 'cursor'
+
     page_size = 20
+    pagination_mode = PAGINATION_MODE_PAGE
+    cursor_ordering = ['-created_at', '-id']
+    count_strategy = PageNumberPagination.COUNT_EXACT
+    count_cache_timeout = 60
+
+    def get_cursor_ordering(self, request):
+        return self.cursor_ordering
+
+    def get_pagination(self, request, objects):
+        if self.pagination_mode == self.PAGINATION_MODE_CURSOR or \
+                CursorPagination.CURSOR_PARAM in request.query_params:
+            return CursorPagination(objects, request, page_size=self.page_size,
+                                    ordering=self.get_cursor_ordering(request))
+        return PageNumberPagination(objects, request, page_size=self.page_size,
+                                    count_strategy=self.count_strategy,
+                                    count_cache_timeout=self.count_cache_timeout)
 
     def list(self, request):
-        objects = self.get_queryset(request).all()
-        paginated = PageNumberPagination(objects, request, page_size=self.page_size)
+        objects = self.optimize_queryset(self.get_queryset(request)).all()
+        paginated = self.get_pagination(request, objects)
         return Response(
             data=self.serializer_class(
                 paginated.get_result(),
@@ -1,3 +1,32 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import FetchLog, Proxy, SourceFetchStats
+
+
+@admin.register(Proxy)
+class ProxyAdmin(admin.ModelAdmin):
+    list_display = ('address', 'latency', 'error_rate', 'requests', 'failures', 'evicted_until')
+    readonly_fields = ('latency', 'error_rate', 'requests', 'failures')
+    ordering = ('latency',)
+
+
+@admin.register(SourceFetchStats)
+class SourceFetchStatsAdmin(admin.ModelAdmin):
+    list_display = ('source', 'fetches', 'not_modified', 'failures', 'new_posts',
+                    'total_duration', 'total_bytes', 'duration_per_post', 'last_fetched')
+    list_select_related = ('source',)
+    ordering = ('-total_duration',)
+    raw_id_fields = ('source',)
+
+
+@admin.register(FetchLog)
+class FetchLogAdmin(admin.ModelAdmin):
+    list_display = ('source', 'fetched_at', 'duration', 'size', 'status_code',
+                    'new_posts', 'not_modified')
+    list_select_related = ('source',)
+    list_filter = ('not_modified', 'status_code')
+    raw_id_fields = ('source',)
+    date_hierarchy = 'fetched_at'
+
+    def has_change_permission(self, request, obj=None):
+        return False
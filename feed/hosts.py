@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def get_host(url):
+    """
+    :param str url:
+    :rtype: str
+    """
+    return (urlsplit(url).netloc or url).lower()
+
+
+def interleave_by_host(sources, limit=None):
+    """
+    Orders sources round robin over their hosts so requests to one host are
+    spread over the batch instead of arriving together
+    :param list[feed.models.Source] sources:
+    :param int limit: most sources taken per host, the rest are left out
+    :rtype: list[feed.models.Source]
+    """
+    by_host = OrderedDict()
+    for source in sources:
+        queue = by_host.setdefault(get_host(source.url_key or source.feed_url), [])
+        if limit is None or len(queue) < limit:
+            queue.append(source)
+    result = []
+    for i in range(max((len(queue) for queue in by_host.values()), default=0)):
+        result.extend(queue[i] for queue in by_host.values() if i < len(queue))
+    return result
+
+
+class Host(object):
+    def __init__(self, concurrency, user_agent):
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+
+class HostPool(object):
+    """
+    Keeps a keep-alive session per host, so polling many feeds of one host
+    reuses its connections, and is polite to it: at most `concurrency`
+    requests at a time, started at least `delay` seconds apart. Sessions of
+    the least recently polled hosts are closed past `max_hosts`.
+    """
+
+    def __init__(self, concurrency, delay, user_agent, max_hosts):
+        """
+        :param int concurrency:
+        :param float delay: seconds
+        :param str user_agent:
+        :param int max_hosts:
+        """
+        self.concurrency = concurrency
+        self.delay = delay
+        self.user_agent = user_agent
+        self.max_hosts = max_hosts
+        self._hosts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        """
+        :param str host:
+        :rtype: Host
+        """
+        with self._lock:
+            item = self._hosts.get(host)
+            if item is None:
+                item = self._hosts[host] = Host(self.concurrency, self.user_agent)
+            self._hosts.move_to_end(host)
+            while len(self._hosts) > self.max_hosts:
+                # requests in flight keep working, the session only drops
+                # its idle connections
+                self._hosts.popitem(last=False)[1].session.close()
+            return item
+
+    @contextmanager
+    def acquire(self, url):
+        """
+        Waits for a free slot of the host of the url
+        :param str url:
+        :rtype: requests.Session
+        """
+        host = self.get(get_host(url))
+        with host.semaphore:
+            with host.lock:
+                now = time.monotonic()
+                wait = host.next_start - now
+                host.next_start = max(now, host.next_start) + self.delay
+            if wait > 0:
+                time.sleep(wait)
+            yield host.session
+
+    def close(self):
+        with self._lock:
+            for host in self._hosts.values():
+                host.session.close()
+            self._hosts.clear()
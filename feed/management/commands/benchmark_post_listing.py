@@ -0,0 +1,77 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from common.models import CustomUser
+from feed.models import Post, Source
+
+INDEX_NAME = 'feed_post_source_created_idx'
+
+
+class Command(BaseCommand):
+    help = 'Fills the configured database with posts and checks the source ' \
+           'listing query is served by the (source, created) index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=3000000)
+        parser.add_argument('--sources', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the generated rows')
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.create_user(
+            email='benchmark-{}@feedigi.local'.format(int(time.time())),
+            cellphone='benchmark-{}'.format(int(time.time())))
+        try:
+            sources = self.populate(user, options)
+            self.benchmark(user, sources, options['repeat'])
+        finally:
+            if not options['keep']:
+                Post.objects.filter(source__user=user).delete()
+                Source.objects.filter(user=user).delete()
+                user.delete()
+
+    def populate(self, user, options):
+        Source.objects.bulk_create([
+            Source(user=user, feed_url='http://benchmark.local/{}'.format(i))
+            for i in range(options['sources'])
+        ])
+        sources = list(Source.objects.filter(user=user))
+
+        start = time.monotonic()
+        now = datetime.datetime.now()
+        batch = []
+        for i in range(options['posts']):
+            batch.append(Post(
+                source=sources[i % len(sources)],
+                uuid=str(i),
+                body='',
+                created=now - datetime.timedelta(minutes=i),
+            ))
+            if len(batch) == options['batch_size']:
+                with transaction.atomic():
+                    Post.objects.bulk_create(batch)
+                batch = []
+        Post.objects.bulk_create(batch)
+        self.stdout.write('Inserted {} posts in {:.1f}s'.format(
+            options['posts'], time.monotonic() - start))
+        return sources
+
+    def benchmark(self, user, sources, repeat):
+        query_set = Post.get_all_by_source_and_user(sources[0], user)
+        plan = query_set.explain()
+        self.stdout.write(plan)
+
+        start = time.monotonic()
+        for i in range(repeat):
+            source = sources[i % len(sources)]
+            list(Post.get_all_by_source_and_user(source, user)[:20])
+        self.stdout.write('First page: {:.2f}ms per query'.format(
+            (time.monotonic() - start) * 1000 / repeat))
+
+        if INDEX_NAME not in plan:
+            raise CommandError('The listing query does not use {}'.format(INDEX_NAME))
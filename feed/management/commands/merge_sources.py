@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from common.models import invalidate_count_cache
+from feed.models import Post, Source
+
+
+class Command(BaseCommand):
+    help = 'Folds per-user sources created before shared feeds into ' \
+           'subscriptions of canonical feeds'
+
+    def handle(self, *args, **options):
+        legacy = Source.objects.filter(user__isnull=False, feed__isnull=True)
+        merged = 0
+        for source in legacy.iterator():
+            with transaction.atomic():
+                self.merge(source)
+            merged += 1
+        invalidate_count_cache(Post)
+        self.stdout.write('Merged {} sources'.format(merged))
+
+    def merge(self, source):
+        feed = Source.get_canonical(source.feed_url)
+        known = Post.objects.filter(source=feed).values('uuid')
+        Post.objects.filter(source=source, uuid__in=known).delete()
+        Post.objects.filter(source=source).update(source=feed)
+
+        Source.add_subscriber(feed.pk)
+        source.feed = feed
+        source.save(update_fields=['feed', 'url_key'])
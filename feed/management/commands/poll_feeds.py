@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from feed.poller import Poller
+
+
+class Command(BaseCommand):
+    help = 'Polls due sources concurrently and stores their new posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Poll a single batch and exit')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument('--timeout', type=int, default=None)
+
+    def handle(self, *args, **options):
+        poller = Poller(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            timeout=options['timeout']
+        )
+        poller.run(once=options['once'])
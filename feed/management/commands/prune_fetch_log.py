@@ -0,0 +1,20 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from feed.models import FetchLog
+
+
+class Command(BaseCommand):
+    help = 'Deletes the fetch log rows past the retention period, the ' \
+           'per source totals are kept'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.FEED_FETCH_LOG['RETENTION_DAYS'])
+
+    def handle(self, *args, **options):
+        before = datetime.datetime.now() - datetime.timedelta(days=options['days'])
+        deleted = FetchLog.prune(before)
+        self.stdout.write('Deleted {} fetch logs older than {}'.format(deleted, before))
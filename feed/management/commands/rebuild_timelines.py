@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from common.models import CustomUser
+from feed.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Refills the materialized timelines, run it after turning ' \
+           '`materialized_timeline` on or off for users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('users', nargs='*', type=int,
+                            help='Ids of the users, all materialized ones by default')
+
+    def handle(self, *args, **options):
+        if options['users']:
+            users = CustomUser.objects.filter(pk__in=options['users'])
+        else:
+            users = CustomUser.objects.filter(materialized_timeline=True)
+        rebuilt = 0
+        for user in users.iterator():
+            entries = TimelineEntry.rebuild(user)
+            self.stdout.write('{}: {} entries'.format(user, entries))
+            rebuilt += 1
+        self.stdout.write('Rebuilt {} timelines'.format(rebuilt))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from feed.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Drops the materialized timeline entries past ' \
+           'FEED_TIMELINE[\'MAX_LENGTH\'] per user, run it periodically'
+
+    def add_arguments(self, parser):
+        parser.add_argument('users', nargs='*', type=int,
+                            help='Ids of the users, all of them by default')
+
+    def handle(self, *args, **options):
+        deleted = TimelineEntry.trim(options['users'] or None)
+        self.stdout.write('Deleted {} entries past {} per user'.format(
+            deleted, settings.FEED_TIMELINE['MAX_LENGTH']))
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0002_auto_20200629_0930'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='source',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.0.14 on 2026-10-18 14:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from urllib.parse import urlsplit, urlunsplit
+
+
+def normalize_feed_url(url):
+    # copy of feed.models.normalize_feed_url as of this migration
+    url = url.strip()
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = '{}:{}'.format(host, parts.port)
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))[:255]
+
+
+def fill_url_key(apps, schema_editor):
+    Source = apps.get_model('feed', 'Source')
+    sources = list(Source.objects.only('id', 'feed_url'))
+    for source in sources:
+        source.url_key = normalize_feed_url(source.feed_url)
+    Source.objects.bulk_update(sources, ['url_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('feed', '0003_source_etag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='source',
+            name='feed',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='subscriptions', to='feed.Source'),
+        ),
+        migrations.AddField(
+            model_name='source',
+            name='url_key',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='source',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sources', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_url_key, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='source',
+            constraint=models.UniqueConstraint(condition=models.Q(user__isnull=True), fields=('url_key',), name='unique_canonical_source_url_key'),
+        ),
+    ]
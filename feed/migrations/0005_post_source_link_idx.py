@@ -0,0 +1,17 @@
+# Generated by Django 3.0.14 on 2026-10-18 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0004_shared_feeds'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['source', 'link'], name='feed_post_source_link_idx'),
+        ),
+    ]
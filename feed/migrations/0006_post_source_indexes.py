@@ -0,0 +1,39 @@
+# Generated by Django 3.0.14 on 2026-10-18 14:44
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_posts(apps, schema_editor):
+    Post = apps.get_model('feed', 'Post')
+    duplicates = Post.objects.values('source_id', 'uuid').annotate(
+        first_id=Min('id'), count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates.iterator():
+        Post.objects.filter(
+            source_id=duplicate['source_id'],
+            uuid=duplicate['uuid'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0005_post_source_link_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='uuid',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['source', '-created', '-id'], name='feed_post_source_created_idx'),
+        ),
+        migrations.RunPython(delete_duplicate_posts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='post',
+            constraint=models.UniqueConstraint(fields=('source', 'uuid'), name='unique_post_source_uuid'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.0.14 on 2026-10-18 14:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadState',
+            fields=[
+                ('source', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='read_state', serialize=False, to='feed.Source')),
+                ('read_up_to', models.BigIntegerField(default=0)),
+                ('exceptions', models.TextField(blank=True, default='')),
+            ],
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.0.14 on 2026-10-18 14:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+import django.db.models.deletion
+
+
+def copy_post_state(apps, schema_editor):
+    # The state was shared by everyone seeing the post, every one of them
+    # keeps seeing it
+    Post = apps.get_model('feed', 'Post')
+    Source = apps.get_model('feed', 'Source')
+    PostInteraction = apps.get_model('feed', 'PostInteraction')
+    posts = Post.objects.filter(
+        Q(is_liked__isnull=False) | Q(is_bookmarked__isnull=False)
+    ).values_list('id', 'source_id', 'source__user_id', 'is_liked', 'is_bookmarked')
+
+    subscribers, batch = {}, []
+    for post_id, source_id, user_id, is_liked, is_bookmarked in posts.iterator():
+        if source_id not in subscribers:
+            subscribers[source_id] = set(Source.objects.filter(
+                feed_id=source_id).values_list('user_id', flat=True))
+            if user_id:
+                subscribers[source_id].add(user_id)
+        for subscriber_id in subscribers[source_id]:
+            batch.append(PostInteraction(user_id=subscriber_id, post_id=post_id,
+                                         is_liked=is_liked, is_bookmarked=is_bookmarked))
+        if len(batch) >= 1000:
+            PostInteraction.objects.bulk_create(batch)
+            batch = []
+    PostInteraction.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('feed', '0008_readstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostInteraction',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_liked', models.BooleanField(blank=True, default=None, null=True)),
+                ('is_bookmarked', models.BooleanField(blank=True, default=None, null=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='interactions', to='feed.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_interactions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='postinteraction',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_post_interaction_user_post'),
+        ),
+        migrations.RunPython(copy_post_state, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='post',
+            name='is_bookmarked',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='is_liked',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.0.14 on 2026-10-18 15:10
+
+from django.db import migrations
+
+from common.search import FullTextIndex
+
+post_search_index = FullTextIndex('feed_post', ['title', 'body'])
+
+
+def install(apps, schema_editor):
+    post_search_index.install(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    post_search_index.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0009_postinteraction'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.0.14 on 2026-10-18 15:01
+
+import common.fields
+from django.db import migrations
+
+from common.search import FullTextIndex
+from common.text import normalize_persian
+
+old_search_index = FullTextIndex('feed_post', ['title', 'body'])
+new_search_index = FullTextIndex('feed_post', ['title_normalized', 'body'])
+
+
+def drop_old_search_index(apps, schema_editor):
+    old_search_index.uninstall(schema_editor.connection)
+
+
+def create_old_search_index(apps, schema_editor):
+    old_search_index.install(schema_editor.connection)
+
+
+def drop_new_search_index(apps, schema_editor):
+    new_search_index.uninstall(schema_editor.connection)
+
+
+def create_new_search_index(apps, schema_editor):
+    new_search_index.install(schema_editor.connection)
+
+
+def normalize(apps, schema_editor):
+    for model_name, source_field, field in (('Source', 'name', 'name_normalized'),
+                                            ('Post', 'title', 'title_normalized')):
+        model = apps.get_model('feed', model_name)
+        batch = []
+        for obj in model.objects.only('id', source_field).iterator():
+            setattr(obj, field, normalize_persian(getattr(obj, source_field)))
+            batch.append(obj)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, [field])
+                batch = []
+        model.objects.bulk_update(batch, [field])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0010_post_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_old_search_index, create_old_search_index),
+        migrations.AddField(
+            model_name='post',
+            name='title_normalized',
+            field=common.fields.NormalizedTextField(blank=True, editable=False, null=True, source_field='title'),
+        ),
+        migrations.AddField(
+            model_name='source',
+            name='name_normalized',
+            field=common.fields.NormalizedCharField(blank=True, db_index=True, editable=False, max_length=255, null=True, source_field='name'),
+        ),
+        migrations.RunPython(normalize, migrations.RunPython.noop),
+        migrations.RunPython(create_new_search_index, drop_new_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0011_normalized_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='source',
+            name='last_uuid',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
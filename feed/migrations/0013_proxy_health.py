@@ -0,0 +1,38 @@
+# Generated by Django 3.0.14 on 2026-10-18 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0012_source_last_uuid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proxy',
+            name='error_rate',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='proxy',
+            name='evicted_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='proxy',
+            name='failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='proxy',
+            name='latency',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='proxy',
+            name='requests',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
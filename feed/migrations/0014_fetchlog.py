@@ -0,0 +1,49 @@
+# Generated by Django 3.0.14 on 2026-10-18 15:14
+
+import common.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0013_proxy_health'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceFetchStats',
+            fields=[
+                ('source', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fetch_stats', serialize=False, to='feed.Source')),
+                ('fetches', models.PositiveIntegerField(default=0)),
+                ('not_modified', models.PositiveIntegerField(default=0)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('new_posts', models.PositiveIntegerField(default=0)),
+                ('total_duration', models.FloatField(db_index=True, default=0)),
+                ('total_bytes', models.BigIntegerField(default=0)),
+                ('last_fetched', models.DateTimeField(null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'source fetch stats',
+            },
+            bases=(models.Model, common.models.PaginationSortable),
+        ),
+        migrations.CreateModel(
+            name='FetchLog',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('fetched_at', models.DateTimeField(db_index=True)),
+                ('duration', models.FloatField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('status_code', models.PositiveSmallIntegerField(default=0)),
+                ('new_posts', models.PositiveIntegerField(null=True)),
+                ('not_modified', models.BooleanField(default=False)),
+                ('source', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='fetch_logs', to='feed.Source')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='fetchlog',
+            index=models.Index(fields=['source', '-fetched_at'], name='feed_fetchlog_source_idx'),
+        ),
+    ]
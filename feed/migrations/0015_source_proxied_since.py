@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0014_fetchlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='source',
+            name='proxied_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
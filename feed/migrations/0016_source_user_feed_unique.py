@@ -0,0 +1,32 @@
+# Generated by Django 3.0.14 on 2026-10-18 15:50
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def delete_duplicate_subscriptions(apps, schema_editor):
+    Source = apps.get_model('feed', 'Source')
+    duplicates = Source.objects.filter(feed__isnull=False).values('user_id', 'feed_id').annotate(
+        first_id=Min('id'), count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates.iterator():
+        Source.objects.filter(
+            user_id=duplicate['user_id'],
+            feed_id=duplicate['feed_id'],
+        ).exclude(id=duplicate['first_id']).delete()
+        Source.objects.filter(pk=duplicate['feed_id']).update(
+            num_subs=F('num_subs') - (duplicate['count'] - 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0015_source_proxied_since'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_subscriptions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='source',
+            constraint=models.UniqueConstraint(fields=('user', 'feed'), name='unique_source_user_feed'),
+        ),
+    ]
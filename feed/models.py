@@ -1,22 +1,60 @@
 import datetime
 import logging
 import uuid
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlsplit, urlunsplit
 
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_migrate
 
-from common.models import BaseModel, CustomUser
+from common.fields import NormalizedCharField, NormalizedTextField
+from common.models import BaseModel, CustomUser, PaginationFilterable, \
+    PaginationSearchable, PaginationSortable, invalidate_count_cache, \
+    track_count_cache
+from common.search import FullTextIndex
 
 
-class Source(BaseModel):
+def normalize_feed_url(url):
+    """
+    Builds the key subscriptions of the same feed are grouped by
+    :param str url:
+    :rtype: str
+    """
+    url = url.strip()
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = '{}:{}'.format(host, parts.port)
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))[:255]
+
+
+class Source(BaseModel, PaginationFilterable, PaginationSearchable):
     # This is an actual feed that we poll
+    # Rows without a user are canonical feeds shared by every subscription
+    # row pointing at them through `feed`, only those and legacy rows without
+    # a `feed` are polled and own posts.
     user = models.ForeignKey(
         to=CustomUser,
         related_name='sources',
         on_delete=models.CASCADE,
-
+        null=True,
+        blank=True,
     )
+    feed = models.ForeignKey(
+        to='self',
+        related_name='subscriptions',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
+    url_key = models.CharField(max_length=255, db_index=True, null=True, blank=True)
     name = models.CharField(max_length=255, blank=True, null=True)
+    name_normalized = NormalizedCharField('name', max_length=255, db_index=True)
     site_url = models.CharField(max_length=255, blank=True, null=True)
     feed_url = models.CharField(max_length=255)
     image_url = models.CharField(max_length=255, blank=True, null=True)
@@ -28,6 +66,7 @@ class Source(BaseModel):
         default=datetime.datetime(1900, 1, 1))  # default to distant past to put new sources to front of queue
     last_modified = models.CharField(max_length=255, blank=True,
                                      null=True)  # just pass this back and forward between server and me , no need to parse
+    etag = models.CharField(max_length=255, blank=True, null=True)  # same as last_modified
 
     last_result = models.CharField(max_length=255, blank=True, null=True)
     interval = models.PositiveIntegerField(default=400)
@@ -39,14 +78,157 @@ class Source(BaseModel):
     last_302_start = models.DateTimeField(null=True, blank=True)
 
     max_index = models.IntegerField(default=0)
+    # newest entry of the last poll, parsing stops there next time
+    last_uuid = models.CharField(max_length=255, null=True, blank=True)
 
     num_subs = models.IntegerField(default=1)
 
     is_cloud_flare = models.BooleanField(default=False)
+    # set when a direct fetch was refused, polls go through proxies from then
+    # on with an occasional direct probe that clears it, see ProxyPool
+    proxied_since = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['url_key'],
+                condition=Q(user__isnull=True),
+                name='unique_canonical_source_url_key'
+            ),
+            models.UniqueConstraint(fields=['user', 'feed'],
+                                    name='unique_source_user_feed'),
+        ]
 
     def __str__(self):
         return self.display_name
 
+    @classmethod
+    def get_filterable_fields(cls):
+        return ['name']
+
+    @classmethod
+    def get_searchable_fields(cls):
+        return ['name']
+
+    def save(self, *args, **kwargs):
+        self.url_key = normalize_feed_url(self.feed_url)
+        return super().save(*args, **kwargs)
+
+    @property
+    def posts_source_id(self):
+        return self.feed_id or self.pk
+
+    @property
+    def posts_source(self):
+        return self.feed if self.feed_id else self
+
+    @classmethod
+    def add_subscriber(cls, feed_id):
+        cls.objects.filter(pk=feed_id).update(num_subs=F('num_subs') + 1, live=True)
+
+    @classmethod
+    def remove_subscriber(cls, feed_id):
+        cls.objects.filter(pk=feed_id).update(num_subs=F('num_subs') - 1)
+        cls.objects.filter(pk=feed_id, num_subs__lte=0).update(live=False)
+
+    @classmethod
+    def get_canonical(cls, feed_url):
+        obj, created = cls.objects.get_or_create(
+            url_key=normalize_feed_url(feed_url),
+            user=None,
+            defaults={
+                'feed_url': feed_url,
+                'num_subs': 0,
+            }
+        )
+        return obj
+
+    @classmethod
+    def subscribe(cls, user, feed_url, **kwargs):
+        """
+        Creates a subscription row for the user and counts it on the canonical
+        feed, which is fetched once no matter how many users follow it. A user
+        who already follows the feed gets the existing subscription back.
+        :param common.models.CustomUser user:
+        :param str feed_url:
+        :rtype: Source
+        """
+        feed = cls.get_canonical(feed_url)
+        source = cls.objects.filter(user=user, feed=feed).first()
+        if source:
+            return source
+        try:
+            with transaction.atomic():
+                source = cls.objects.create(user=user, feed=feed, feed_url=feed_url, **kwargs)
+                cls.add_subscriber(feed.pk)
+        except IntegrityError:
+            # a concurrent request subscribed the user first
+            return cls.objects.get(user=user, feed=feed)
+        if user.materialized_timeline:
+            TimelineEntry.rebuild(user)
+        return source
+
+    def change_feed_url(self, feed_url):
+        """
+        Moves a subscription to the canonical feed of the new url
+        :param str feed_url:
+        """
+        if normalize_feed_url(feed_url) == self.url_key:
+            self.feed_url = feed_url
+            return
+        if self.feed_id:
+            Source.remove_subscriber(self.feed_id)
+        feed = Source.get_canonical(feed_url)
+        Source.add_subscriber(feed.pk)
+        self.feed = feed
+        self.feed_url = feed_url
+
+    def move(self, feed_url):
+        """
+        Points a polled feed at the url it was redirected to. A canonical
+        feed whose new url already has its own canonical feed is merged into
+        that one instead.
+        :param str feed_url:
+        :return: false when the feed was merged and is no longer polled
+        :rtype: bool
+        """
+        url_key = normalize_feed_url(feed_url)
+        if len(feed_url) > 255 or feed_url == self.feed_url:
+            return True
+        try:
+            with transaction.atomic():
+                Source.objects.filter(pk=self.pk).update(feed_url=feed_url, url_key=url_key)
+        except IntegrityError:
+            self.merge_into(Source.objects.get(url_key=url_key, user=None))
+            return False
+        self.feed_url = feed_url
+        self.url_key = url_key
+        return True
+
+    def merge_into(self, feed):
+        """
+        Hands the subscriptions and posts of this canonical feed over to
+        another one and stops polling it. Posts the other feed already has
+        stay behind.
+        :param Source feed:
+        """
+        with transaction.atomic():
+            Post.objects.filter(source=self).exclude(
+                uuid__in=Post.objects.filter(source=feed).values('uuid')
+            ).update(source=feed)
+            # users who follow both feeds keep the subscription they have there
+            Source.objects.filter(feed=self, user__in=Source.objects.filter(
+                feed=feed).values('user')).delete()
+            moved = Source.objects.filter(feed=self).update(feed=feed)
+            Source.objects.filter(pk=feed.pk).update(
+                num_subs=F('num_subs') + moved, live=True)
+            Source.objects.filter(pk=self.pk).update(num_subs=0, live=False)
+            # the duplicates left behind are no longer in any subscription
+            TimelineEntry.objects.filter(post__source=self).delete()
+        invalidate_count_cache(Post)
+        self.num_subs = 0
+        self.live = False
+
     @property
     def best_link(self):
         if self.site_url is None or self.site_url == '':
@@ -62,34 +244,58 @@ class Source(BaseModel):
             return self.name
 
 
-class Post(BaseModel):
+# Kept up to date by the database, see FullTextIndex
+post_search_index = FullTextIndex('feed_post', ['title_normalized', 'body'])
+
+
+class Post(BaseModel, PaginationSearchable):
     source = models.ForeignKey(
         to=Source,
         on_delete=models.CASCADE,
         related_name='posts'
     )
     title = models.TextField(blank=True)
+    title_normalized = NormalizedTextField('title')
     body = models.TextField()
     link = models.CharField(max_length=512, blank=True, null=True)
     found = models.DateTimeField(auto_now_add=True)
     created = models.DateTimeField(db_index=True)
-    uuid = models.CharField(max_length=255, db_index=True)
+    uuid = models.CharField(max_length=255)
     author = models.CharField(max_length=255, blank=True, null=True)
     image_url = models.CharField(max_length=255, blank=True, null=True)
-    is_liked = models.BooleanField(default=None, blank=True, null=True)
-    is_bookmarked = models.BooleanField(default=None, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'link'], name='feed_post_source_link_idx'),
+            models.Index(fields=['source', '-created', '-id'],
+                         name='feed_post_source_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'uuid'],
+                                    name='unique_post_source_uuid'),
+        ]
 
     def __str__(self):
         return "%s: post %s" % (self.source.display_name, self.title)
 
-    def like(self: 'Post') -> None:
-        self.is_liked = True
-        return self.save()
+    def delete(self, using=None, keep_parents=False):
+        result = super().delete(using=using, keep_parents=keep_parents)
+        invalidate_count_cache(Post)
+        return result
+
+    @classmethod
+    def get_searchable_fields(cls):
+        return ['title', 'body']
+
+    @classmethod
+    def get_search_index(cls):
+        return post_search_index
 
-    def unlike(self: 'Post') -> None:
-        self.is_liked = False
-        return self.save()
+    def like(self: 'Post', user) -> None:
+        PostInteraction.set_state(user, self.pk, is_liked=True)
 
+    def unlike(self: 'Post', user) -> None:
+        PostInteraction.set_state(user, self.pk, is_liked=False)
 
     def save(self, *args, **kwargs):
         if not self.uuid:
@@ -98,16 +304,580 @@ class Post(BaseModel):
             self.created = datetime.datetime.now()
         return super().save(*args, **kwargs)
 
+    @classmethod
+    def ingest(cls, source, entries, now=None):
+        """
+        Stores the entries of a parsed feed that the source does not have yet.
+        Known entries are found with a single query on uuid and link, new ones
+        are inserted with one bulk insert in the same transaction that advances
+        `Source.max_index`.
+        :param Source source:
+        :param list[dict] entries: keyword arguments of Post, see feed.parser
+        :param datetime.datetime now: default for entries without a date
+        :return: the new posts
+        :rtype: list[Post]
+        """
+        if not entries:
+            return []
+        now = now or datetime.datetime.now()
+        uuids = {str(entry['uuid']) for entry in entries if entry.get('uuid')}
+        links = {entry['link'] for entry in entries if entry.get('link')}
+
+        with transaction.atomic():
+            known_uuids, known_links = set(), set()
+            for post_uuid, link in cls.objects.filter(source=source).filter(
+                    Q(uuid__in=uuids) | Q(link__in=links)
+            ).values_list('uuid', 'link'):
+                known_uuids.add(post_uuid)
+                known_links.add(link)
+
+            posts = []
+            for entry in entries:
+                post = cls(source=source, **entry)
+                post.uuid = str(post.uuid or uuid.uuid4())
+                post.created = post.created or now
+                if post.uuid in known_uuids or (post.link and post.link in known_links):
+                    continue
+                known_uuids.add(post.uuid)
+                known_links.add(post.link)
+                posts.append(post)
+
+            if posts:
+                cls.objects.bulk_create(posts, ignore_conflicts=True)
+                Source.objects.filter(pk=source.pk).update(
+                    max_index=F('max_index') + len(posts))
+                source.max_index += len(posts)
+                TimelineEntry.fan_out(source, posts)
+                invalidate_count_cache(cls)
+        return posts
+
+    @classmethod
+    def get_timeline(cls, user):
+        """
+        Posts of every source the user follows, newest first, in one query
+        :param common.models.CustomUser user:
+        """
+        source_ids = Source.objects.filter(user=user).values(
+            posts_source_id=Coalesce('feed_id', 'id'))
+        return cls.objects.filter(
+            source_id__in=source_ids
+        ).order_by('-created', '-id')
+
     @classmethod
     def get_all_by_source_and_user(cls, source, user):
+        if source.user_id != user.pk:
+            return cls.objects.none()
         return cls.objects.filter(
-            source=source,
-            source__user=user
-        ).all()
+            source_id=source.posts_source_id
+        ).order_by('-created', '-id')
+
+
+class TimelineEntry(models.Model):
+    # Copy of the timeline of a user with `materialized_timeline` set, written
+    # when posts are ingested and kept in reading order so a page of it is a
+    # range scan of the user's rows instead of a sort across their sources
+    user = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    post = models.ForeignKey(
+        to=Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    created = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created', '-post'],
+                         name='feed_timeline_user_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_user_post'),
+        ]
+
+    @classmethod
+    def fan_out(cls, source, posts):
+        """
+        Appends new posts of a source to the timelines of its subscribers
+        that are materialized
+        :param Source source: the source owning the posts
+        :param list[Post] posts:
+        """
+        user_ids = set(Source.objects.filter(
+            Q(feed=source) | Q(pk=source.pk),
+            user__materialized_timeline=True,
+        ).values_list('user_id', flat=True))
+        if not user_ids:
+            return
+        # bulk_create does not set primary keys on every backend
+        new_posts = Post.objects.filter(
+            source=source, uuid__in=[post.uuid for post in posts]
+        ).values_list('id', 'created')
+        cls.objects.bulk_create([
+            cls(user_id=user_id, post_id=post_id, created=created)
+            for post_id, created in new_posts
+            for user_id in user_ids
+        ], ignore_conflicts=True)
+
+    @classmethod
+    def trim(cls, user_ids=None):
+        """
+        Drops the entries past `FEED_TIMELINE['MAX_LENGTH']` in a single
+        statement. Ingesting does not trim, the trim_timelines command does
+        it periodically.
+        :param collections.Iterable[int] user_ids: every user by default
+        :return: number of deleted entries
+        :rtype: int
+        """
+        table = cls._meta.db_table
+        where, params = '', []
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            if not user_ids:
+                return 0
+            where = ' WHERE user_id IN ({})'.format(', '.join(['%s'] * len(user_ids)))
+            params = user_ids
+        sql = (
+            'DELETE FROM {table} WHERE id IN ('
+            'SELECT id FROM ('
+            'SELECT id, ROW_NUMBER() OVER ('
+            'PARTITION BY user_id ORDER BY created DESC, post_id DESC) AS position '
+            'FROM {table}{where}) ranked '
+            'WHERE position > %s)'
+        ).format(table=table, where=where)
+        with connections[cls.objects.db].cursor() as cursor:
+            cursor.execute(sql, params + [settings.FEED_TIMELINE['MAX_LENGTH']])
+            return cursor.rowcount
+
+    @classmethod
+    def rebuild(cls, user):
+        """
+        Refills the timeline of a user from the posts of their sources, or
+        empties it when the user does not use a materialized timeline
+        :param common.models.CustomUser user:
+        """
+        max_length = settings.FEED_TIMELINE['MAX_LENGTH']
+        with transaction.atomic():
+            cls.objects.filter(user=user).delete()
+            if not user.materialized_timeline:
+                return 0
+            entries = [
+                cls(user=user, post_id=post_id, created=created)
+                for post_id, created in Post.get_timeline(user).values_list(
+                    'id', 'created')[:max_length]
+            ]
+            cls.objects.bulk_create(entries)
+        return len(entries)
+
+    @classmethod
+    def get_timeline(cls, user):
+        """
+        Posts of the materialized timeline of the user in the order of
+        the (user, created, post) index
+        :param common.models.CustomUser user:
+        """
+        return Post.objects.filter(timeline_entries__user=user).annotate(
+            timeline_created=F('timeline_entries__created'),
+            timeline_post_id=F('timeline_entries__post_id'),
+        ).order_by('-timeline_created', '-timeline_post_id')
+
+
+class ReadState(models.Model):
+    # Read posts of a subscription. Every post with an id up to `read_up_to`
+    # is read and every later one unread, except the ids in `exceptions`
+    # which have the opposite state. Post ids only grow, so marking a whole
+    # source read just moves the mark past the newest post.
+    source = models.OneToOneField(
+        to=Source,
+        on_delete=models.CASCADE,
+        related_name='read_state',
+        primary_key=True
+    )
+    read_up_to = models.BigIntegerField(default=0)
+    exceptions = models.TextField(blank=True, default='')
+
+    def get_exceptions(self):
+        """
+        :rtype: set[int]
+        """
+        return {int(post_id) for post_id in self.exceptions.split(',') if post_id}
+
+    def set_exceptions(self, post_ids):
+        self.exceptions = ','.join(str(post_id) for post_id in sorted(post_ids))
+
+    def is_read(self, post_id):
+        return (post_id <= self.read_up_to) != (post_id in self.get_exceptions())
+
+    def compact(self, exceptions):
+        """
+        Moves the mark over the posts right after it that were read one by
+        one, so a user reading in order does not grow the exceptions
+        :param set[int] exceptions: modified in place
+        """
+        newer_ids = Post.objects.filter(
+            source_id=self.source.posts_source_id, id__gt=self.read_up_to
+        ).order_by('id').values_list('id', flat=True)[:len(exceptions) + 1]
+        for post_id in newer_ids:
+            if post_id not in exceptions:
+                break
+            exceptions.remove(post_id)
+            self.read_up_to = post_id
+
+    @classmethod
+    def mark(cls, source, post_ids, read=True):
+        """
+        :param Source source: subscription of the user
+        :param collections.Iterable[int] post_ids:
+        :param bool read:
+        :rtype: ReadState
+        """
+        with transaction.atomic():
+            state, created = cls.objects.select_for_update().get_or_create(source=source)
+            exceptions = state.get_exceptions()
+            for post_id in post_ids:
+                if ((post_id <= state.read_up_to) != (post_id in exceptions)) != read:
+                    exceptions ^= {post_id}
+            if len(exceptions) > settings.FEED_READ_STATE['MAX_EXCEPTIONS']:
+                state.compact(exceptions)
+            state.set_exceptions(exceptions)
+            state.save()
+        return state
+
+    @classmethod
+    def mark_all_read(cls, source):
+        """
+        Marks every post of the source read without touching the posts
+        :param Source source: subscription of the user
+        """
+        with transaction.atomic():
+            # a newer id of another source may be ahead of posts of this one
+            # that are not committed yet, those must stay unread
+            last_id = Post.objects.filter(source_id=source.posts_source_id).order_by(
+                '-id').values_list('id', flat=True).first()
+            cls.objects.update_or_create(source=source, defaults={
+                'read_up_to': last_id or 0,
+                'exceptions': '',
+            })
+
+    @classmethod
+    def get_unread_counts(cls, user):
+        """
+        Unread posts of every source of the user in one query
+        :param common.models.CustomUser user:
+        :return: source id to unread count
+        :rtype: dict[int, int]
+        """
+        unread = Post.objects.filter(
+            source_id=OuterRef('posts_source'),
+            id__gt=OuterRef('mark'),
+        ).order_by().values('source_id').annotate(count=Count('*')).values('count')
+        sources = Source.objects.filter(user=user).annotate(
+            posts_source=Coalesce('feed_id', 'id'),
+            mark=Coalesce('read_state__read_up_to', 0),
+        ).annotate(
+            unread=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+        ).values_list('id', 'unread', 'mark', 'read_state__exceptions')
+
+        counts = {}
+        for source_id, count, mark, exceptions in sources:
+            for post_id in cls(exceptions=exceptions or '').get_exceptions():
+                count += 1 if post_id <= mark else -1
+            counts[source_id] = max(count, 0)
+        return counts
+
+
+class PostInteraction(BaseModel):
+    # State a user gave to a post, posts are shared by every subscriber
+    ACTION_LIKE = 'like'
+    ACTION_UNLIKE = 'unlike'
+    ACTION_BOOKMARK = 'bookmark'
+    ACTION_UNBOOKMARK = 'unbookmark'
+    ACTION_READ = 'read'
+    ACTION_UNREAD = 'unread'
+    ACTIONS = {
+        ACTION_LIKE: ('is_liked', True),
+        ACTION_UNLIKE: ('is_liked', False),
+        ACTION_BOOKMARK: ('is_bookmarked', True),
+        ACTION_UNBOOKMARK: ('is_bookmarked', False),
+        ACTION_READ: ('is_read', True),
+        ACTION_UNREAD: ('is_read', False),
+    }
+    STATE_FIELDS = ('is_liked', 'is_bookmarked')
+
+    user = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='post_interactions'
+    )
+    post = models.ForeignKey(
+        to=Post,
+        on_delete=models.CASCADE,
+        related_name='interactions'
+    )
+    is_liked = models.BooleanField(default=None, blank=True, null=True)
+    is_bookmarked = models.BooleanField(default=None, blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_post_interaction_user_post'),
+        ]
+
+    @classmethod
+    def annotate(cls, query_set, user):
+        """
+        Adds the state the user gave to each post as `is_liked` and
+        `is_bookmarked`
+        :param django.db.models.QuerySet query_set: posts
+        :param common.models.CustomUser user:
+        """
+        interactions = cls.objects.filter(user_id=user.pk, post_id=OuterRef('pk'))
+        return query_set.annotate(**{
+            field: Subquery(interactions.values(field)[:1])
+            for field in cls.STATE_FIELDS
+        })
+
+    @classmethod
+    def set_state(cls, user, post_id, **fields):
+        """
+        Upserts the given state fields only
+        :param common.models.CustomUser user:
+        :param int post_id:
+        """
+        fields['updated_at'] = datetime.datetime.now()
+        if cls.objects.filter(user_id=user.pk, post_id=post_id).update(**fields):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user.pk, post_id=post_id, **fields)
+        except IntegrityError:
+            cls.objects.filter(user_id=user.pk, post_id=post_id).update(**fields)
+
+    @classmethod
+    def apply_batch(cls, user, actions):
+        """
+        Applies toggles of many posts in one transaction, later actions on
+        the same post win. Posts the user does not follow are skipped.
+        :param common.models.CustomUser user:
+        :param list[dict] actions: `post_id` and `action` of each toggle
+        :return: ids of the skipped posts
+        :rtype: list[int]
+        """
+        subscriptions = {source.posts_source_id: source
+                         for source in Source.objects.filter(user_id=user.pk)}
+        post_sources = dict(Post.objects.filter(
+            pk__in={action['post_id'] for action in actions},
+            source_id__in=subscriptions,
+        ).values_list('id', 'source_id'))
+
+        states, reads, skipped = {}, {}, []
+        for action in actions:
+            post_id = action['post_id']
+            if post_id not in post_sources:
+                skipped.append(post_id)
+                continue
+            field, value = cls.ACTIONS[action['action']]
+            if field == 'is_read':
+                reads.setdefault(post_sources[post_id], {})[post_id] = value
+            else:
+                states.setdefault(post_id, {})[field] = value
+
+        with transaction.atomic():
+            if states:
+                cls._save_states(user, states)
+            for source_id, values in reads.items():
+                for read in (True, False):
+                    post_ids = [post_id for post_id, value in values.items() if value == read]
+                    if post_ids:
+                        ReadState.mark(subscriptions[source_id], post_ids, read)
+        return skipped
+
+    @classmethod
+    def _save_states(cls, user, states):
+        now = datetime.datetime.now()
+        existing = {
+            interaction.post_id: interaction
+            for interaction in cls.objects.select_for_update().filter(
+                user_id=user.pk, post_id__in=states)
+        }
+        new = []
+        for post_id, fields in states.items():
+            interaction = existing.get(post_id) or cls(user_id=user.pk, post_id=post_id)
+            for field, value in fields.items():
+                setattr(interaction, field, value)
+            interaction.updated_at = now
+            if post_id not in existing:
+                new.append(interaction)
+        if existing:
+            cls.objects.bulk_update(existing.values(),
+                                    list(cls.STATE_FIELDS) + ['updated_at'])
+        if new:
+            cls.objects.bulk_create(new)
 
 
 class Proxy(BaseModel):
     address = models.CharField(max_length=255)
+    # health kept by feed.proxies.ProxyPool, latency is an EWMA in seconds
+    latency = models.FloatField(null=True, blank=True)
+    error_rate = models.FloatField(default=0)
+    requests = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    evicted_until = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def url(self):
+        return self.address if '://' in self.address else 'http://' + self.address
 
     def __str__(self):
         return "Proxy:{}".format(self.address)
+
+
+class FetchLog(models.Model):
+    # One row per poll of a feed, appended in bulk by the poller and never
+    # updated. Rows past FEED_FETCH_LOG['RETENTION_DAYS'] are dropped by the
+    # prune_fetch_log command, the totals live on in SourceFetchStats.
+    id = models.BigAutoField(primary_key=True)
+    source = models.ForeignKey(
+        to=Source,
+        on_delete=models.CASCADE,
+        related_name='fetch_logs',
+        db_index=False
+    )
+    fetched_at = models.DateTimeField(db_index=True)
+    # seconds
+    duration = models.FloatField()
+    # bytes of the body read
+    size = models.PositiveIntegerField(default=0)
+    status_code = models.PositiveSmallIntegerField(default=0)
+    # None when the poll failed
+    new_posts = models.PositiveIntegerField(null=True)
+    not_modified = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', '-fetched_at'],
+                         name='feed_fetchlog_source_idx'),
+        ]
+
+    @classmethod
+    def record(cls, logs, batch_size=None):
+        """
+        Appends the logs and adds them to the totals of their sources
+        :param list[FetchLog] logs:
+        :param int batch_size:
+        """
+        if not logs:
+            return
+        with transaction.atomic():
+            cls.objects.bulk_create(logs, batch_size=batch_size)
+            SourceFetchStats.add(logs, batch_size=batch_size)
+
+    @classmethod
+    def prune(cls, before):
+        """
+        :param datetime.datetime before:
+        :return: number of deleted rows
+        :rtype: int
+        """
+        # nothing points at the log and it has no delete receivers, so
+        # Django deletes it with a single DELETE query
+        return cls.objects.filter(fetched_at__lt=before).delete()[0]
+
+
+class SourceFetchStats(models.Model, PaginationSortable):
+    # Running totals of the FetchLog rows of a feed, ranking feeds by what
+    # they cost us is a sort of this table instead of an aggregate of the log
+    UPDATE_FIELDS = ['fetches', 'not_modified', 'failures', 'new_posts',
+                     'total_duration', 'total_bytes', 'last_fetched']
+
+    source = models.OneToOneField(
+        to=Source,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='fetch_stats'
+    )
+    fetches = models.PositiveIntegerField(default=0)
+    not_modified = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    new_posts = models.PositiveIntegerField(default=0)
+    total_duration = models.FloatField(default=0, db_index=True)
+    total_bytes = models.BigIntegerField(default=0)
+    last_fetched = models.DateTimeField(null=True)
+
+    class Meta:
+        verbose_name_plural = 'source fetch stats'
+
+    @classmethod
+    def get_sortable_fields(cls):
+        return ['fetches', 'not_modified', 'failures', 'new_posts',
+                'total_duration', 'total_bytes', 'last_fetched']
+
+    @property
+    def duration_per_post(self):
+        """
+        Seconds spent fetching for each new post, the cost of a feed
+        relative to what it brings
+        :rtype: float|None
+        """
+        return self.total_duration / self.new_posts if self.new_posts else None
+
+    @classmethod
+    def add(cls, logs, batch_size=None):
+        """
+        :param list[FetchLog] logs:
+        :param int batch_size:
+        """
+        existing = cls.objects.select_for_update().in_bulk(
+            {log.source_id for log in logs})
+        created = {}
+        for log in logs:
+            stats = existing.get(log.source_id) or created.get(log.source_id)
+            if stats is None:
+                stats = created[log.source_id] = cls(source_id=log.source_id)
+            stats.fetches += 1
+            stats.not_modified += log.not_modified
+            stats.failures += log.new_posts is None
+            stats.new_posts += log.new_posts or 0
+            stats.total_duration += log.duration
+            stats.total_bytes += log.size
+            stats.last_fetched = max(filter(None, (stats.last_fetched, log.fetched_at)))
+        cls.objects.bulk_update(existing.values(), cls.UPDATE_FIELDS, batch_size=batch_size)
+        cls.objects.bulk_create(created.values(), batch_size=batch_size)
+        if created:
+            invalidate_count_cache(cls)
+
+
+track_count_cache(Source, SourceFetchStats)
+# posts are deleted in bulk, the deleting code paths invalidate the counts
+track_count_cache(Post, deletes=False)
+
+
+def _remove_subscriber_receiver(sender, instance, **kwargs):
+    # also runs for cascades and queryset deletes, e.g. when a user is deleted
+    if instance.feed_id:
+        Source.remove_subscriber(instance.feed_id)
+        # the posts of the feed stay, drop them from the user's timeline
+        # unless another subscription of the user still shows them
+        if instance.user_id and not Source.objects.filter(
+                user_id=instance.user_id, feed_id=instance.feed_id).exists():
+            TimelineEntry.objects.filter(
+                user_id=instance.user_id, post__source_id=instance.feed_id).delete()
+    else:
+        # the posts of the source went with it, timeline entries included
+        invalidate_count_cache(Post)
+
+
+post_delete.connect(_remove_subscriber_receiver, sender=Source,
+                    dispatch_uid='remove_source_subscriber')
+
+
+def _install_search_index_receiver(sender, app_config, using, **kwargs):
+    if app_config.label == 'feed':
+        post_search_index.install(connections[using], create=False)
+
+
+post_migrate.connect(_install_search_index_receiver,
+                     dispatch_uid='install_post_search_index')
@@ -0,0 +1,187 @@
+import hashlib
+from email.utils import parsedate_to_datetime
+from xml.etree import ElementTree
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+ATOM_NS = '{http://www.w3.org/2005/Atom}'
+CONTENT_NS = '{http://purl.org/rss/1.0/modules/content/}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+MEDIA_NS = '{http://search.yahoo.com/mrss/}'
+RSS1_NS = '{http://purl.org/rss/1.0/}'
+
+ENTRY_TAGS = ('item', RSS1_NS + 'item', ATOM_NS + 'entry')
+
+
+class FeedParseError(Exception):
+    pass
+
+
+def parse_date(value):
+    """
+    Parses RFC 822 (RSS) and ISO 8601 (Atom) dates into naive local datetimes
+    :param str value:
+    :rtype: datetime.datetime|None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        try:
+            date = parse_datetime(value)
+        except ValueError:
+            date = None
+    if date is None:
+        return None
+    if timezone.is_aware(date):
+        date = timezone.make_naive(date)
+    return date
+
+
+def _text(element, *tags):
+    for tag in tags:
+        child = element.find(tag)
+        if child is not None and child.text:
+            return child.text.strip()
+    return None
+
+
+def _atom_link(element):
+    fallback = None
+    for link in element.findall(ATOM_NS + 'link'):
+        rel = link.get('rel', 'alternate')
+        if rel == 'alternate':
+            return link.get('href')
+        if fallback is None and rel != 'self':
+            fallback = link.get('href')
+    return fallback
+
+
+def _image(element):
+    for tag in (MEDIA_NS + 'content', MEDIA_NS + 'thumbnail', 'enclosure'):
+        child = element.find(tag)
+        if child is None:
+            continue
+        if tag == 'enclosure' and not (child.get('type') or '').startswith('image/'):
+            continue
+        if child.get('url'):
+            return child.get('url')
+    return None
+
+
+def _make_uuid(guid, link, title, body):
+    if guid:
+        return guid[:255]
+    if link:
+        return link[:255]
+    return hashlib.sha1('{}\n{}'.format(title, body).encode()).hexdigest()
+
+
+def parse_entry(element, max_body_size=None):
+    """
+    Maps a single `item` / `entry` element to the keyword arguments of a Post
+    :param xml.etree.ElementTree.Element element:
+    :param int max_body_size: characters kept of the body
+    :rtype: dict
+    """
+    if element.tag == ATOM_NS + 'entry':
+        title = _text(element, ATOM_NS + 'title')
+        body = _text(element, ATOM_NS + 'content', ATOM_NS + 'summary')
+        link = _atom_link(element)
+        guid = _text(element, ATOM_NS + 'id')
+        author = _text(element, ATOM_NS + 'author/' + ATOM_NS + 'name')
+        created = _text(element, ATOM_NS + 'published', ATOM_NS + 'updated')
+    else:
+        ns = RSS1_NS if element.tag == RSS1_NS + 'item' else ''
+        title = _text(element, ns + 'title')
+        body = _text(element, CONTENT_NS + 'encoded', ns + 'description')
+        link = _text(element, ns + 'link')
+        guid = _text(element, 'guid') or element.get(
+            '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about')
+        author = _text(element, 'author', DC_NS + 'creator')
+        created = _text(element, 'pubDate', DC_NS + 'date')
+
+    return {
+        'uuid': _make_uuid(guid, link, title, body),
+        'title': title or '',
+        'body': (body or '')[:max_body_size],
+        'link': link[:512] if link else None,
+        'author': author[:255] if author else None,
+        'image_url': (_image(element) or '')[:255] or None,
+        'created': parse_date(created),
+    }
+
+
+def iter_entries(chunks, stop_uuid=None, max_entries=None, max_body_size=None,
+                 max_bytes=None):
+    """
+    Parses an RSS 2.0, RSS 1.0 or Atom document incrementally while it is
+    downloaded and yields its entries one by one. Parsed entries are dropped
+    from the tree, so memory does not grow with the size of the feed.
+    :param collections.Iterable[bytes] chunks:
+    :param str stop_uuid: stops before the entry with this uuid
+    :param int max_entries: stops after this many entries
+    :param int max_body_size: characters kept of each body
+    :param int max_bytes: stops reading after this many bytes
+    :rtype: collections.Iterator[dict]
+    """
+    parser = ElementTree.XMLPullParser(events=('start', 'end'))
+    parents = []
+    count = received = 0
+    try:
+        for chunk in chunks:
+            received += len(chunk)
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == 'start':
+                    parents.append(element)
+                    continue
+                parents.pop()
+                if element.tag not in ENTRY_TAGS:
+                    continue
+                entry = parse_entry(element, max_body_size)
+                if parents:
+                    parents[-1].remove(element)
+                if stop_uuid is not None and entry['uuid'] == stop_uuid:
+                    return
+                yield entry
+                count += 1
+                if max_entries and count >= max_entries:
+                    return
+            if max_bytes and received >= max_bytes:
+                return
+        parser.close()
+    except ElementTree.ParseError as e:
+        raise FeedParseError(str(e))
+
+
+def get_newest_uuid(entries, previous=None, found_previous=False):
+    """
+    The uuid later parses of the feed can stop at, only known for feeds
+    that list entries newest first
+    :param list[dict] entries: in document order
+    :param str previous: the uuid the parse stopped at
+    :param bool found_previous: the parse stopped there, so all the entries
+        are newer than it, even a single one
+    :rtype: str|None
+    """
+    dates = [entry['created'] for entry in entries]
+    if any(newer is not None and older is not None and newer < older
+           for newer, older in zip(dates, dates[1:])):
+        return None
+    if found_previous or (len(dates) >= 2 and None not in dates):
+        return entries[0]['uuid']
+    # a single or undated entry does not tell the order of the feed
+    return previous
+
+
+def parse_feed(content):
+    """
+    Parses a whole RSS 2.0, RSS 1.0 or Atom document into a list of entries
+    :param bytes content:
+    :rtype: list[dict]
+    """
+    return list(iter_entries([content]))
@@ -0,0 +1,464 @@
+import datetime
+import logging
+import math
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+from django.conf import settings
+from django.db import transaction
+
+from feed.hosts import HostPool, get_host, interleave_by_host
+from feed.models import FetchLog, Post, Source
+from feed.parser import FeedParseError, get_newest_uuid, iter_entries
+from feed.proxies import ProxyPool
+from feed.scheduler import AdaptiveScheduler
+
+logger = logging.getLogger(__name__)
+
+
+PERMANENT_REDIRECT_CODES = (301, 308)
+REDIRECT_CODES = PERMANENT_REDIRECT_CODES + (302, 303, 307)
+
+
+class FetchResult(object):
+    def __init__(self, source, status_code=0, entries=None, parse_error=None,
+                 error=None, duration=0.0, etag=None, last_modified=None,
+                 server=None, size=0, proxy=None, redirects=None,
+                 found_last_uuid=False):
+        """
+        :param feed.models.Source source:
+        :param int status_code:
+        :param list[dict] entries: parsed entries, see feed.parser
+        :param str parse_error:
+        :param str error:
+        :param float duration:
+        :param str etag:
+        :param str last_modified:
+        :param str server: the Server header
+        :param int size: bytes of the body read
+        :param feed.models.Proxy proxy: the request went through
+        :param list[tuple[int, str]] redirects: status and location of each hop
+        :param bool found_last_uuid: parsing stopped at the newest entry of
+            the previous poll, the entries are all newer
+        """
+        self.source = source
+        self.status_code = status_code
+        self.entries = entries
+        self.parse_error = parse_error
+        self.error = error
+        self.duration = duration
+        self.etag = etag
+        self.last_modified = last_modified
+        self.server = server
+        self.size = size
+        self.proxy = proxy
+        self.redirects = redirects or []
+        self.found_last_uuid = found_last_uuid
+
+    @property
+    def is_success(self):
+        return self.error is None and 200 <= self.status_code < 300
+
+    @property
+    def is_not_modified(self):
+        return self.error is None and self.status_code == 304
+
+    @property
+    def permanent_url(self):
+        """
+        Where the leading permanent redirects of the chain end up
+        :rtype: str|None
+        """
+        url = None
+        for status_code, location in self.redirects:
+            if status_code not in PERMANENT_REDIRECT_CODES:
+                break
+            url = location
+        return url
+
+    @property
+    def temporary_url(self):
+        """
+        Where the chain ends up when any of its redirects is temporary
+        :rtype: str|None
+        """
+        if any(status_code not in PERMANENT_REDIRECT_CODES
+               for status_code, location in self.redirects):
+            return self.redirects[-1][1]
+        return None
+
+    @property
+    def is_cloud_flare_challenge(self):
+        return self.status_code in (403, 503) and \
+            'cloudflare' in (self.server or '').lower()
+
+
+def get_conditional_headers(source):
+    """
+    Sends back the validators of the previous response so unchanged feeds
+    are answered with an empty 304
+    :param feed.models.Source source:
+    :rtype: dict
+    """
+    headers = {}
+    if source.etag:
+        headers['If-None-Match'] = source.etag
+    if source.last_modified:
+        headers['If-Modified-Since'] = source.last_modified
+    return headers
+
+
+class ByteCounter(object):
+    def __init__(self):
+        self.size = 0
+
+    def count(self, chunks):
+        for chunk in chunks:
+            self.size += len(chunk)
+            yield chunk
+
+
+def parse_response(response, source, counter=None):
+    """
+    Parses the body while it is downloaded, up to the newest entry of the
+    previous poll
+    :param requests.Response response:
+    :param feed.models.Source source:
+    :param ByteCounter counter: adds up the size of the body read
+    :return: the new entries and whether parsing stopped at that entry
+    :rtype: (list[dict], bool)
+    """
+    conf = settings.FEED_PARSER
+    chunks = response.iter_content(conf['CHUNK_SIZE'])
+    entries = []
+    # the generator is lazy, the rest of the body is not read after a break
+    for entry in iter_entries(
+            counter.count(chunks) if counter else chunks,
+            max_entries=conf['MAX_ENTRIES'],
+            max_body_size=conf['MAX_BODY_SIZE'],
+            max_bytes=conf['MAX_BYTES']):
+        if source.last_uuid is not None and entry['uuid'] == source.last_uuid:
+            return entries, True
+        entries.append(entry)
+    return entries, False
+
+
+def get(session, source, timeout, proxies, max_redirects, redirects):
+    """
+    Follows redirects itself to record every hop in `redirects`
+    :rtype: requests.Response
+    """
+    url = source.feed_url
+    while True:
+        response = session.get(url, timeout=timeout, stream=True, allow_redirects=False,
+                               headers=get_conditional_headers(source),
+                               proxies=proxies)
+        location = response.headers.get('Location')
+        if response.status_code not in REDIRECT_CODES or not location:
+            return response
+        response.close()
+        if len(redirects) >= max_redirects:
+            raise requests.TooManyRedirects()
+        url = urljoin(url, location)
+        redirects.append((response.status_code, url))
+
+
+def fetch(session, source, timeout, proxy=None, max_redirects=5):
+    """
+    Downloads and parses a single feed. Runs inside the worker threads so it
+    must not touch the database.
+    :param requests.Session session:
+    :param feed.models.Source source:
+    :param int timeout:
+    :param feed.models.Proxy proxy:
+    :param int max_redirects:
+    :rtype: FetchResult
+    """
+    start = time.monotonic()
+    entries, parse_error, found_last_uuid = None, None, False
+    proxies = {'http': proxy.url, 'https': proxy.url} if proxy else None
+    redirects = []
+    counter = ByteCounter()
+    try:
+        response = get(session, source, timeout, proxies, max_redirects, redirects)
+        try:
+            if 200 <= response.status_code < 300:
+                entries, found_last_uuid = parse_response(response, source, counter)
+        except FeedParseError as e:
+            parse_error = str(e)
+        finally:
+            response.close()
+    except requests.RequestException as e:
+        return FetchResult(source, error=e.__class__.__name__,
+                           duration=time.monotonic() - start, proxy=proxy,
+                           redirects=redirects)
+
+    return FetchResult(
+        source,
+        status_code=response.status_code,
+        entries=entries,
+        found_last_uuid=found_last_uuid,
+        parse_error=parse_error,
+        duration=time.monotonic() - start,
+        etag=response.headers.get('ETag'),
+        last_modified=response.headers.get('Last-Modified'),
+        server=response.headers.get('Server'),
+        size=counter.size,
+        proxy=proxy,
+        redirects=redirects
+    )
+
+
+class Poller(object):
+    SOURCE_UPDATE_FIELDS = [
+        'last_polled', 'due_poll', 'interval', 'last_result', 'last_success',
+        'last_change', 'live', 'status_code', 'etag', 'last_modified',
+        'last_uuid', 'is_cloud_flare', 'proxied_since', 'feed_url', 'url_key',
+        'last_302_url', 'last_302_start',
+    ]
+
+    def __init__(self, batch_size=None, workers=None, timeout=None):
+        conf = settings.FEED_POLLER
+        self.batch_size = batch_size or conf['BATCH_SIZE']
+        self.workers = workers or conf['WORKERS']
+        self.timeout = timeout or conf['TIMEOUT']
+        self.idle_sleep = conf['IDLE_SLEEP']
+        self.scheduler = AdaptiveScheduler()
+        self.host_batch_limit = conf['HOST_BATCH_LIMIT']
+        self.max_redirects = conf['MAX_REDIRECTS']
+        self.promote_after = datetime.timedelta(seconds=conf['PROMOTE_REDIRECT_AFTER'])
+        self.hosts = HostPool(
+            concurrency=conf['HOST_CONCURRENCY'],
+            delay=conf['HOST_DELAY'],
+            user_agent=conf['USER_AGENT'],
+            max_hosts=conf['MAX_HOSTS'],
+        )
+        self.proxies = ProxyPool()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def close(self):
+        self.executor.shutdown()
+        self.hosts.close()
+
+    def get_due_sources(self, now):
+        """
+        Due sources spread over their hosts, those past the per host limit
+        stay due for the next batch
+        """
+        return interleave_by_host(list(Source.objects.filter(
+            feed__isnull=True,
+            live=True,
+            due_poll__lte=now
+        ).order_by('due_poll')[:self.batch_size]), self.host_batch_limit)
+
+    def fetch(self, source):
+        """
+        Fetches directly, or through a proxy for sources that block us
+        :param feed.models.Source source:
+        :rtype: FetchResult
+        """
+        blocked = self.proxies.is_blocked(source, datetime.datetime.now())
+        proxy = self.proxies.choose() if blocked else None
+        timeout = min(self.timeout, self.proxies.timeout) if proxy else self.timeout
+        with self.hosts.acquire(source.feed_url) as session:
+            result = fetch(session, source, timeout, proxy, self.max_redirects)
+        if proxy:
+            self.proxies.record(proxy, result, datetime.datetime.now())
+        return result
+
+    def get_lease(self, sources):
+        """
+        Seconds the batch takes at worst: every request and redirect times
+        out, each host serves `HOST_CONCURRENCY` requests at a time started
+        `HOST_DELAY` apart and the workers are all busy
+        :param list[feed.models.Source] sources:
+        :rtype: float
+        """
+        per_host = Counter(get_host(source.url_key or source.feed_url) for source in sources)
+        rounds = max(math.ceil(len(sources) / self.workers), *(
+            math.ceil(count / self.hosts.concurrency) for count in per_host.values()))
+        request = self.timeout * (1 + self.max_redirects)
+        return rounds * request + max(per_host.values()) * self.hosts.delay
+
+    def claim(self, sources, now):
+        """
+        Pushes the due date of the selected sources past the worst case
+        duration of the batch so a concurrently running poller does not
+        pick up the same sources while they are in flight.
+        """
+        lease = now + datetime.timedelta(seconds=self.get_lease(sources) + self.timeout)
+        Source.objects.filter(pk__in=[source.pk for source in sources]).update(
+            due_poll=lease)
+
+    def poll_batch(self):
+        """
+        Fetches one batch of due sources concurrently and writes the results
+        back in bulk
+        :return: number of polled sources
+        :rtype: int
+        """
+        now = datetime.datetime.now()
+        sources = self.get_due_sources(now)
+        if not sources:
+            return 0
+        self.claim(sources, now)
+        self.proxies.load(now)
+
+        futures = [self.executor.submit(self.fetch, source) for source in sources]
+
+        logs = [self.process_safely(source, future) for source, future in zip(sources, futures)]
+
+        Source.objects.bulk_update(sources, self.SOURCE_UPDATE_FIELDS,
+                                   batch_size=self.batch_size)
+        FetchLog.record(logs, batch_size=self.batch_size)
+        self.proxies.save()
+        return len(sources)
+
+    def process_safely(self, source, future):
+        """
+        Processes the fetch of one source, an unexpected error of the fetch or
+        of ingesting its posts is logged and recorded as a failed poll so the
+        rest of the batch is still written back
+        :param feed.models.Source source:
+        :param concurrent.futures.Future future: of Poller.fetch
+        :rtype: FetchLog
+        """
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.exception('Fetching %s failed', source.feed_url)
+            result = FetchResult(source, error=e.__class__.__name__)
+
+        state = {field: getattr(source, field) for field in self.SOURCE_UPDATE_FIELDS}
+        try:
+            with transaction.atomic():
+                return self.process_result(result, datetime.datetime.now())
+        except Exception as e:
+            logger.exception('Processing %s failed', source.feed_url)
+            for field, value in state.items():
+                setattr(source, field, value)
+            return self.process_result(
+                FetchResult(source, status_code=result.status_code, error=e.__class__.__name__,
+                            duration=result.duration, size=result.size),
+                datetime.datetime.now())
+
+    def process_result(self, result, now):
+        """
+        :param FetchResult result:
+        :param datetime.datetime now:
+        :return: the log of the fetch, saved with the rest of the batch
+        :rtype: FetchLog
+        """
+        source = result.source
+        source.last_polled = now
+        source.status_code = result.status_code
+
+        new_posts = self.apply_result(result, now)
+        self.scheduler.reschedule(source, now, new_posts)
+        if new_posts:
+            source.last_change = now
+        return FetchLog(
+            source=source,
+            fetched_at=now,
+            duration=result.duration,
+            size=result.size,
+            status_code=result.status_code,
+            new_posts=new_posts,
+            not_modified=result.is_not_modified,
+        )
+
+    def apply_redirects(self, result, now):
+        """
+        Rewrites the url of moved feeds so later polls skip the redirects, at
+        once for permanent ones and for temporary ones once they have pointed
+        at the same url for `PROMOTE_REDIRECT_AFTER`
+        :param FetchResult result:
+        :param datetime.datetime now:
+        :return: false when the feed was merged into the feed of its new url
+        :rtype: bool
+        """
+        source = result.source
+        url = result.permanent_url
+        temporary_url = result.temporary_url
+        if temporary_url is None:
+            source.last_302_url = source.last_302_start = None
+        elif temporary_url[:255] != source.last_302_url:
+            source.last_302_url, source.last_302_start = temporary_url[:255], now
+        elif now - source.last_302_start >= self.promote_after:
+            url = temporary_url
+            source.last_302_url = source.last_302_start = None
+        return url is None or source.move(url)
+
+    def apply_result(self, result, now):
+        """
+        :param FetchResult result:
+        :param datetime.datetime now:
+        :return: number of new posts or None when the poll failed
+        :rtype: int|None
+        """
+        source = result.source
+
+        if result.error:
+            source.last_result = result.error
+            return None
+
+        if result.status_code == 410:
+            source.live = False
+
+        if result.is_cloud_flare_challenge and not result.proxy:
+            source.is_cloud_flare = True
+        self.proxies.update_source(source, result, now)
+
+        if (result.is_success or result.is_not_modified) and \
+                not self.apply_redirects(result, now):
+            source.last_result = 'Merged into the feed it redirects to'
+            return None
+
+        if result.is_not_modified:
+            source.last_success = now
+            source.last_result = 'Not modified'
+            return 0
+
+        if not result.is_success:
+            source.last_result = 'HTTP {}'.format(result.status_code)
+            return None
+
+        if result.parse_error is not None:
+            source.last_result = 'Parse error: {}'.format(result.parse_error)[:255]
+            return None
+
+        entries = result.entries
+        if entries:
+            source.last_uuid = get_newest_uuid(
+                entries, source.last_uuid, result.found_last_uuid)
+        source.etag = result.etag[:255] if result.etag else None
+        source.last_modified = \
+            result.last_modified[:255] if result.last_modified else None
+
+        new_posts = len(Post.ingest(source, entries, now))
+        source.last_success = now
+        source.last_result = 'OK ({} new)'.format(new_posts)
+        return new_posts
+
+    def run(self, once=False):
+        try:
+            while True:
+                try:
+                    polled = self.poll_batch()
+                except Exception:
+                    if once:
+                        raise
+                    # e.g. the database went away, leased sources are
+                    # picked up again once their lease expires
+                    logger.exception('Polling a batch failed')
+                    polled = 0
+                logger.info('Polled %d sources', polled)
+                if once:
+                    return
+                if polled < self.batch_size:
+                    time.sleep(self.idle_sleep)
+        finally:
+            self.close()
@@ -0,0 +1,120 @@
+import datetime
+import random
+import threading
+
+from django.conf import settings
+from django.db.models import Q
+
+from feed.models import Proxy
+
+
+class ProxyPool(object):
+    """
+    Rotation of the Proxy rows that sources blocking direct fetches are
+    routed through. Each request updates the latency and error rate of its
+    proxy in memory, proxies that get too slow or fail too often are evicted
+    for a while and requests go to one of the fastest healthy ones.
+    """
+    # responses telling the source refuses us rather than being broken
+    BLOCKED_STATUS_CODES = (403, 429, 503)
+    # errors of the proxy itself, anything else that goes wrong on the way
+    # to the source, e.g. a dead host the proxy answers with a 502 for, is
+    # not held against the proxy
+    PROXY_ERRORS = ('ProxyError', 'ConnectTimeout')
+    GATEWAY_STATUS_CODES = (502, 504)
+    UPDATE_FIELDS = ['latency', 'error_rate', 'requests', 'failures', 'evicted_until']
+
+    def __init__(self):
+        conf = settings.FEED_PROXIES
+        self.timeout = conf['TIMEOUT']
+        self.alpha = conf['EWMA_ALPHA']
+        self.max_latency = conf['MAX_LATENCY']
+        self.max_error_rate = conf['MAX_ERROR_RATE']
+        self.evict_for = datetime.timedelta(seconds=conf['EVICT_FOR'])
+        self.choices = conf['CHOICES']
+        self.probe_after = datetime.timedelta(seconds=conf['PROBE_AFTER'])
+        self.proxies = []
+        self._changed = set()
+        self._lock = threading.Lock()
+
+    def load(self, now):
+        """
+        Reloads the proxies that are not evicted, once per batch
+        :param datetime.datetime now:
+        """
+        proxies = list(Proxy.objects.filter(
+            Q(evicted_until__isnull=True) | Q(evicted_until__lte=now)))
+        with self._lock:
+            self.proxies = proxies
+            self._changed = set()
+
+    def is_blocked(self, source, now):
+        """
+        Whether the source is fetched through a proxy: it is behind
+        CloudFlare or a direct fetch was refused, except for a direct probe
+        every `PROBE_AFTER` to find out whether it still is. Sources that did
+        not answer at all are most likely dead, proxies would not help them.
+        :param feed.models.Source source:
+        :param datetime.datetime now:
+        """
+        if source.is_cloud_flare:
+            return True
+        return source.proxied_since is not None and \
+            now - source.proxied_since < self.probe_after
+
+    def update_source(self, source, result, now):
+        """
+        Sets or clears the proxy route of the source after a direct fetch
+        :param feed.models.Source source:
+        :param feed.poller.FetchResult result:
+        :param datetime.datetime now:
+        """
+        if result.proxy is not None or result.error:
+            return
+        if result.status_code in self.BLOCKED_STATUS_CODES:
+            source.proxied_since = now
+        elif source.proxied_since is not None and \
+                (result.is_success or result.is_not_modified):
+            source.proxied_since = None
+
+    def choose(self):
+        """
+        One of the fastest healthy proxies, untried ones first
+        :rtype: feed.models.Proxy|None
+        """
+        with self._lock:
+            ranked = sorted(self.proxies, key=lambda proxy: (
+                (proxy.latency or 0) * (1 + proxy.error_rate)))
+            return random.choice(ranked[:self.choices]) if ranked else None
+
+    def record(self, proxy, result, now):
+        """
+        :param feed.models.Proxy proxy:
+        :param feed.poller.FetchResult result: of a request through the proxy
+        :param datetime.datetime now:
+        """
+        failed = result.error in self.PROXY_ERRORS or \
+            result.status_code in self.BLOCKED_STATUS_CODES
+        succeeded = result.error is None and not failed and \
+            result.status_code not in self.GATEWAY_STATUS_CODES
+        with self._lock:
+            proxy.requests += 1
+            if failed or succeeded:
+                proxy.error_rate += self.alpha * ((1 if failed else 0) - proxy.error_rate)
+            if failed:
+                proxy.failures += 1
+            if succeeded:
+                proxy.latency = result.duration if proxy.latency is None else \
+                    proxy.latency + self.alpha * (result.duration - proxy.latency)
+            if proxy.error_rate > self.max_error_rate or \
+                    (proxy.latency or 0) > self.max_latency:
+                proxy.evicted_until = now + self.evict_for
+                if proxy in self.proxies:
+                    self.proxies.remove(proxy)
+            self._changed.add(proxy)
+
+    def save(self):
+        with self._lock:
+            changed, self._changed = list(self._changed), set()
+        if changed:
+            Proxy.objects.bulk_update(changed, self.UPDATE_FIELDS)
@@ -0,0 +1,67 @@
+import datetime
+import math
+
+from django.conf import settings
+
+
+class AdaptiveScheduler(object):
+    """
+    Moves `Source.interval` towards the rate new posts actually show up.
+
+    A poll that finds new posts shortens the interval to half of the gap
+    since the previous change, an unchanged poll grows it slowly, and failed
+    or long stale sources back off exponentially. Sources with many
+    subscribers get a proportionally lower ceiling.
+    """
+    THROTTLE_STATUS_CODES = (429, 503)
+
+    def __init__(self, min_interval=None, max_interval=None):
+        conf = settings.FEED_SCHEDULER
+        self.min_interval = min_interval or conf['MIN_INTERVAL']
+        self.max_interval = max_interval or conf['MAX_INTERVAL']
+        self.growth_factor = conf['GROWTH_FACTOR']
+        self.backoff_factor = conf['BACKOFF_FACTOR']
+        self.stale_after = datetime.timedelta(seconds=conf['STALE_AFTER'])
+
+    def get_max_interval(self, source):
+        subscribers = max(source.num_subs, 1)
+        return max(self.min_interval,
+                   int(self.max_interval / (1 + math.log2(subscribers))))
+
+    def is_stale(self, source, now):
+        last_change = source.last_change or source.created_at
+        return last_change is None or now - last_change > self.stale_after
+
+    def get_interval(self, source, now, new_posts):
+        """
+        :param feed.models.Source source:
+        :param datetime.datetime now:
+        :param int|None new_posts: None when the poll failed
+        :rtype: int
+        """
+        interval = source.interval or self.min_interval
+
+        if source.status_code in self.THROTTLE_STATUS_CODES:
+            interval *= self.backoff_factor ** 2
+        elif new_posts is None:
+            interval *= self.backoff_factor
+        elif new_posts:
+            interval /= self.backoff_factor
+            if source.last_change:
+                gap = (now - source.last_change).total_seconds()
+                interval = min(interval, gap / 2)
+        elif self.is_stale(source, now):
+            interval *= self.backoff_factor
+        else:
+            interval *= self.growth_factor
+
+        return int(min(max(interval, self.min_interval),
+                       self.get_max_interval(source)))
+
+    def reschedule(self, source, now, new_posts):
+        """
+        Updates interval and due_poll in place, call before last_change is
+        moved to now
+        """
+        source.interval = self.get_interval(source, now, new_posts)
+        source.due_poll = now + datetime.timedelta(seconds=source.interval)
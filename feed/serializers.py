@@ -1,7 +1,8 @@
 from rest_framework import serializers
 
-from common.serializers import BaseModelSerializer
-from feed.models import Source, Post
+from common.serializers import BaseSerializer, BaseModelSerializer
+from feed.models import Source, SourceFetchStats, Post, PostInteraction, TimelineEntry, \
+    normalize_feed_url
 from user.serializers import ProfileSerializer
 
 
@@ -10,12 +11,38 @@ class SourceSerializer(BaseModelSerializer):
 
     class Meta:
         model = Source
-        exclude = ['updated_at']
+        exclude = ['updated_at', 'name_normalized']
+        read_only_fields = ['feed', 'url_key', 'num_subs']
+
+    def validate(self, attrs):
+        feed_url = attrs.get('feed_url')
+        if self.instance and self.instance.feed_id and feed_url and Source.objects.filter(
+                user=self.instance.user_id, feed__url_key=normalize_feed_url(feed_url)
+        ).exclude(pk=self.instance.pk).exists():
+            raise serializers.ValidationError({
+                'feed_url': 'You are already subscribed to this feed'
+            })
+        return attrs
+
+    def create(self, validated_data):
+        return Source.subscribe(**validated_data)
+
+    def update(self, instance, validated_data):
+        feed_url = validated_data.pop('feed_url', None)
+        feed_id = instance.feed_id
+        if feed_url and instance.feed_id:
+            instance.change_feed_url(feed_url)
+        elif feed_url:
+            instance.feed_url = feed_url
+        instance = super().update(instance, validated_data)
+        if instance.feed_id != feed_id and instance.user.materialized_timeline:
+            TimelineEntry.rebuild(instance.user)
+        return instance
 
 
 class CurrentSourceDefault(object):
     def set_context(self, serializer_field):
-        self.source_id = serializer_field.context['source'].pk
+        self.source_id = serializer_field.context['source'].posts_source_id
 
     def __call__(self):
         return self.source_id
@@ -32,17 +59,42 @@ class PostSerializer(BaseModelSerializer):
     )
     created = serializers.DateTimeField(read_only=True)
     uuid = serializers.UUIDField(read_only=True)
+    # annotated per user by PostInteraction.annotate
+    is_liked = serializers.BooleanField(read_only=True, allow_null=True)
+    is_bookmarked = serializers.BooleanField(read_only=True, allow_null=True)
 
     class Meta:
         model = Post
-        exclude = ['updated_at']
+        exclude = ['updated_at', 'title_normalized']
 
     def validate(self, attrs):
-        source = self.context.get('source')
-        if not Source.get_by_pk(source.pk):
+        if not self.context.get('source'):
             raise serializers.ValidationError({
                 'source': {
                     'source_id': 'The requested source is not found'
                 }
             })
         return attrs
+
+
+class InteractionSerializer(BaseSerializer):
+    post_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=list(PostInteraction.ACTIONS))
+
+
+class InteractionBatchSerializer(BaseSerializer):
+    actions = InteractionSerializer(many=True, allow_empty=False)
+
+    def create(self, validated_data):
+        return PostInteraction.apply_batch(self.context['user'],
+                                           validated_data['actions'])
+
+
+class SourceFetchStatsSerializer(BaseModelSerializer):
+    name = serializers.CharField(source='source.display_name', read_only=True)
+    feed_url = serializers.CharField(source='source.feed_url', read_only=True)
+    duration_per_post = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SourceFetchStats
+        fields = '__all__'
@@ -1,12 +1,41 @@
+import datetime
+import io
 import json
+import threading
+import time
+import tracemalloc
+from unittest import mock
 
-from django.test import TestCase, Client
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models.deletion import Collector
+from django.conf import settings
+from asgiref.sync import async_to_sync
+from django.core.handlers.asgi import ASGIRequest
+from django.test import TestCase, Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.authtoken.models import Token
-from rest_framework.test import APITestCase
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIRequestFactory
+from rest_framework_jwt.utils import jwt_decode_handler
 
-from common.models import CustomUser, JwtToken
-from feed.models import Source, Post
+from common.models import CustomUser, JwtToken, CursorPagination, PageNumberPagination, \
+    PaginationPlan, RevokedToken, invalidate_count_cache
+from common.asgi import ThreadPoolASGIHandler
+from common.auth import CustomTokenAuthentication
+from common.cache import token_cache, revocation_denylist
+from common.text import normalize_persian
+from common.tests import QueryCountTestMixin
+from feed.hosts import HostPool, interleave_by_host
+from feed.models import FetchLog, Source, SourceFetchStats, Post, PostInteraction, Proxy, \
+    ReadState, TimelineEntry
+from feed.parser import FeedParseError, get_newest_uuid, iter_entries, parse_feed
+from feed.poller import FetchResult, Poller
+from feed.proxies import ProxyPool
+from feed.scheduler import AdaptiveScheduler
 from feed.serializers import SourceSerializer
 
 
@@ -333,3 +362,1501 @@ class PostAPIViewTestCase(APITestCase):
     def test_dislike(self):
         response = self.client.delete(self.url)
         self.assertEqual(204, response.status_code)
+
+
+RSS_FEED = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Test</title>
+<item><title>First</title><link>http://test1.com/1</link><guid>1</guid>
+<description>first body</description><pubDate>Mon, 29 Jun 2020 09:30:00 GMT</pubDate></item>
+<item><title>Second</title><link>http://test1.com/2</link><guid>2</guid>
+<description>second body</description></item>
+</channel></rss>"""
+
+
+def mock_response(status_code=200, content=RSS_FEED, headers=None, chunk_size=None):
+    response = mock.Mock(status_code=status_code, headers=headers or {})
+    response.iter_content.side_effect = lambda size: (
+        content[i:i + (chunk_size or size)]
+        for i in range(0, len(content), chunk_size or size))
+    return response
+
+
+class PollerTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.source = Source.objects.create(user=self.user, name='test1',
+                                            feed_url='http://test1.com/rss')
+        self.not_due = Source.objects.create(
+            user=self.user, name='test2', feed_url='http://test2.com/rss',
+            due_poll=datetime.datetime.now() + datetime.timedelta(hours=1))
+
+    def _response(self, status_code=200, content=RSS_FEED, headers=None):
+        return mock_response(status_code, content, headers)
+
+    def test_poll_batch(self):
+        with mock.patch('requests.Session.get', return_value=self._response()) as get:
+            polled = Poller(workers=2).poll_batch()
+
+        self.assertEqual(1, polled)
+        get.assert_called_once()
+        self.source.refresh_from_db()
+        self.assertEqual(200, self.source.status_code)
+        self.assertIsNotNone(self.source.last_success)
+        self.assertIsNotNone(self.source.last_change)
+        self.assertGreater(self.source.due_poll, datetime.datetime.now())
+        self.assertEqual(2, self.source.posts.count())
+
+    def test_one_failing_source_does_not_abort_batch(self):
+        Source.objects.filter(pk=self.not_due.pk).update(due_poll=datetime.datetime(1900, 1, 1))
+        ingest = Post.ingest.__func__
+
+        def failing_ingest(cls, source, entries, now=None):
+            if source.pk == self.source.pk:
+                raise IntegrityError('bad feed')
+            return ingest(cls, source, entries, now)
+
+        with mock.patch('requests.Session.get', return_value=self._response()), \
+                mock.patch('feed.models.Post.ingest', classmethod(failing_ingest)):
+            self.assertEqual(2, Poller(workers=2).poll_batch())
+
+        self.source.refresh_from_db()
+        self.assertEqual('IntegrityError', self.source.last_result)
+        self.assertIsNone(self.source.last_uuid)
+        self.assertIsNone(self.source.last_success)
+        self.assertIsNotNone(self.source.last_polled)
+        self.assertEqual(0, self.source.posts.count())
+        self.assertEqual(2, self.not_due.posts.count())
+        self.assertEqual(2, FetchLog.objects.count())
+        self.assertIsNone(self.source.fetch_logs.get().new_posts)
+
+    def test_fetch_error_does_not_abort_batch(self):
+        with mock.patch('feed.poller.fetch', side_effect=ValueError):
+            self.assertEqual(1, Poller(workers=2).poll_batch())
+
+        self.source.refresh_from_db()
+        self.assertEqual('ValueError', self.source.last_result)
+        self.assertEqual(1, self.source.fetch_logs.count())
+
+    def test_poll_batch_skips_known_posts(self):
+        with mock.patch('requests.Session.get', return_value=self._response()):
+            Poller(workers=2).poll_batch()
+            Source.objects.filter(pk=self.source.pk).update(due_poll=datetime.datetime(1900, 1, 1))
+            Poller(workers=2).poll_batch()
+
+        self.assertEqual(2, self.source.posts.count())
+
+    def test_poll_batch_error(self):
+        with mock.patch('requests.Session.get', return_value=self._response(status_code=500)):
+            Poller(workers=2).poll_batch()
+
+        self.source.refresh_from_db()
+        self.assertEqual(500, self.source.status_code)
+        self.assertIsNone(self.source.last_success)
+        self.assertEqual(0, self.source.posts.count())
+
+    def test_conditional_get(self):
+        headers = {'ETag': '"abc"', 'Last-Modified': 'Mon, 29 Jun 2020 09:30:00 GMT'}
+        with mock.patch('requests.Session.get', return_value=self._response(headers=headers)):
+            Poller(workers=2).poll_batch()
+
+        self.source.refresh_from_db()
+        self.assertEqual('"abc"', self.source.etag)
+        Source.objects.filter(pk=self.source.pk).update(due_poll=datetime.datetime(1900, 1, 1))
+
+        not_modified = self._response(status_code=304, content=b'')
+        with mock.patch('requests.Session.get', return_value=not_modified) as get, \
+                mock.patch('feed.poller.iter_entries') as parse:
+            Poller(workers=2).poll_batch()
+
+        self.assertEqual('"abc"', get.call_args[1]['headers']['If-None-Match'])
+        self.assertEqual(headers['Last-Modified'], get.call_args[1]['headers']['If-Modified-Since'])
+        parse.assert_not_called()
+        self.source.refresh_from_db()
+        self.assertEqual(304, self.source.status_code)
+        self.assertEqual('"abc"', self.source.etag)
+
+
+class AdaptiveSchedulerTestCase(TestCase):
+    def setUp(self):
+        self.scheduler = AdaptiveScheduler(min_interval=300, max_interval=86400)
+        self.now = datetime.datetime.now()
+
+    def _source(self, **kwargs):
+        kwargs.setdefault('interval', 3600)
+        kwargs.setdefault('last_change', self.now - datetime.timedelta(hours=1))
+        kwargs.setdefault('created_at', self.now - datetime.timedelta(days=30))
+        return Source(feed_url='test1.com/.rss', **kwargs)
+
+    def test_changed_source_speeds_up(self):
+        source = self._source(last_change=self.now - datetime.timedelta(minutes=20))
+        self.assertEqual(600, self.scheduler.get_interval(source, self.now, 3))
+
+    def test_unchanged_source_slows_down(self):
+        source = self._source()
+        self.assertEqual(4320, self.scheduler.get_interval(source, self.now, 0))
+
+    def test_failing_and_stale_sources_back_off(self):
+        self.assertEqual(7200, self.scheduler.get_interval(self._source(), self.now, None))
+        self.assertEqual(14400, self.scheduler.get_interval(
+            self._source(status_code=503), self.now, None))
+        stale = self._source(last_change=self.now - datetime.timedelta(days=30))
+        self.assertEqual(7200, self.scheduler.get_interval(stale, self.now, 0))
+
+    def test_bounds(self):
+        self.assertEqual(300, self.scheduler.get_interval(
+            self._source(interval=300), self.now, 5))
+        self.assertEqual(86400, self.scheduler.get_interval(
+            self._source(interval=80000), self.now, None))
+        popular = self._source(interval=80000, num_subs=1024)
+        self.assertEqual(86400 // 11, self.scheduler.get_interval(popular, self.now, None))
+
+
+class SharedFeedTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.other_user = CustomUser.objects.create_user(
+            email='arya@stark.com', password='valar_morghulis', cellphone='09123456780')
+
+    def test_subscribe_shares_canonical_feed(self):
+        first = Source.subscribe(self.user, 'HTTP://Test1.com/rss#top')
+        second = Source.subscribe(self.other_user, 'http://test1.com/rss')
+
+        self.assertEqual(first.feed_id, second.feed_id)
+        feed = Source.objects.get(pk=first.feed_id)
+        self.assertIsNone(feed.user)
+        self.assertEqual(2, feed.num_subs)
+
+        second.delete()
+        feed.refresh_from_db()
+        self.assertEqual(1, feed.num_subs)
+        self.assertTrue(feed.live)
+
+        first.delete()
+        feed.refresh_from_db()
+        self.assertEqual(0, feed.num_subs)
+        self.assertFalse(feed.live)
+
+    def test_cascade_removes_subscriber(self):
+        feed = Source.subscribe(self.user, 'http://test1.com/rss').feed
+        Source.subscribe(self.other_user, 'http://test1.com/rss')
+
+        self.other_user.delete()
+        feed.refresh_from_db()
+        self.assertEqual(1, feed.num_subs)
+
+        Source.objects.filter(user=self.user).delete()
+        feed.refresh_from_db()
+        self.assertEqual(0, feed.num_subs)
+        self.assertFalse(feed.live)
+
+    def test_canonical_feed_polled_once(self):
+        first = Source.subscribe(self.user, 'http://test1.com/rss')
+        second = Source.subscribe(self.other_user, 'http://test1.com/rss')
+        with mock.patch('requests.Session.get', return_value=mock_response()) as get:
+            Poller(workers=2).poll_batch()
+
+        get.assert_called_once()
+        self.assertEqual(2, Post.objects.count())
+        self.assertEqual(2, Post.get_all_by_source_and_user(first, self.user).count())
+        self.assertEqual(2, Post.get_all_by_source_and_user(second, self.other_user).count())
+        self.assertEqual(0, Post.get_all_by_source_and_user(first, self.other_user).count())
+
+    def test_api_create_subscribes(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+        response = self.client.post(reverse('source_list'), {'feed_url': 'test1.com/rss'})
+
+        self.assertEqual(201, response.status_code)
+        source = self.user.sources.get()
+        self.assertEqual(1, source.feed.num_subs)
+        self.assertEqual('http://test1.com/rss', source.feed.url_key)
+
+    def test_subscribe_twice(self):
+        first = Source.subscribe(self.user, 'http://test1.com/rss')
+        second = Source.subscribe(self.user, 'HTTP://Test1.com/rss')
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(1, Source.objects.get(pk=first.feed_id).num_subs)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Source.objects.create(user=self.user, feed=first.feed, feed_url='http://test1.com/rss')
+
+    def test_api_change_to_subscribed_feed(self):
+        Source.subscribe(self.user, 'http://test1.com/rss')
+        source = Source.subscribe(self.user, 'http://test2.com/rss')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+        response = self.client.put(reverse('source_detail', kwargs={'pk': source.pk}),
+                                   {'feed_url': 'test1.com/rss'})
+
+        self.assertEqual(400, response.status_code)
+        source.refresh_from_db()
+        self.assertEqual('http://test2.com/rss', source.url_key)
+
+    def test_merge_keeps_one_subscription(self):
+        old = Source.subscribe(self.user, 'http://old.com/rss').feed
+        new = Source.subscribe(self.user, 'http://new.com/rss').feed
+        Source.subscribe(self.other_user, 'http://old.com/rss')
+
+        old.merge_into(new)
+        new.refresh_from_db()
+
+        self.assertEqual(1, self.user.sources.count())
+        self.assertEqual(2, new.num_subs)
+        self.assertEqual(2, Source.objects.filter(feed=new).count())
+
+
+class PostIngestTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.source = Source.objects.create(user=self.user, feed_url='http://test1.com/rss')
+
+    def _entries(self, count, start=0):
+        return [{
+            'uuid': 'guid-{}'.format(i),
+            'title': 'title {}'.format(i),
+            'body': 'body {}'.format(i),
+            'link': 'http://test1.com/{}'.format(i),
+        } for i in range(start, start + count)]
+
+    def test_ingest_dedupes_by_uuid_and_link(self):
+        Post.ingest(self.source, self._entries(3))
+        entries = self._entries(5)
+        entries[3]['link'] = 'http://test1.com/0'
+        entries.append(dict(entries[4]))
+
+        posts = Post.ingest(self.source, entries)
+
+        self.assertEqual(['guid-4'], [post.uuid for post in posts])
+        self.assertEqual(4, self.source.posts.count())
+        self.source.refresh_from_db()
+        self.assertEqual(4, self.source.max_index)
+
+    def test_ingest_query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            Post.ingest(self.source, self._entries(200))
+
+        self.assertEqual(200, self.source.posts.count())
+        self.assertLess(len(queries), 10)
+
+    def test_listing_uses_source_created_index(self):
+        Post.ingest(self.source, self._entries(50))
+        plan = Post.get_all_by_source_and_user(self.source, self.user).explain()
+        self.assertIn('feed_post_source_created_idx', plan)
+
+
+class CursorPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.source = Source.subscribe(self.user, 'http://test1.com/rss')
+        now = datetime.datetime.now()
+        Post.ingest(Source.objects.get(pk=self.source.feed_id), [{
+            'uuid': str(i),
+            'body': 'body {}'.format(i),
+            'created': now - datetime.timedelta(minutes=i // 2),
+        } for i in range(7)])
+        self.url = reverse('post_list', kwargs={'pk': self.source.pk})
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+
+    def _links(self, response):
+        links = {}
+        for link in response['Link'].split(', '):
+            url, rel = link.split('; rel=')
+            links[rel] = url.strip('<>')
+        return links
+
+    def test_walk_forward_and_back(self):
+        expected = list(Post.get_all_by_source_and_user(self.source, self.user).values_list('id', flat=True))
+        response = self.client.get(self.url, {'cursor': '', 'page_size': 3})
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn('X-Pagination-Total-Count', response)
+        self.assertNotIn('prev', self._links(response))
+
+        seen = []
+        pages = [response]
+        while True:
+            seen.extend(post['id'] for post in json.loads(response.content))
+            links = self._links(response)
+            if 'next' not in links:
+                break
+            response = self.client.get(links['next'])
+            pages.append(response)
+        self.assertEqual(expected, seen)
+        self.assertEqual(3, len(pages))
+
+        response = self.client.get(self._links(pages[-1])['prev'])
+        self.assertEqual(expected[3:6], [post['id'] for post in json.loads(response.content)])
+
+    def test_cursor_with_filters_and_sort(self):
+        request = Request(APIRequestFactory().get(self.url, {
+            'filter__body': 'body', 'exact__uuid': '0', 'sort': 'created'}))
+        paginated = CursorPagination(Post.objects.all(), request, filterable_fields=['body', 'uuid'],
+                                     sortable_fields=['created'], ordering=['-created', '-id'])
+        self.assertEqual(['0'], [post.uuid for post in paginated.get_result()])
+        self.assertEqual([('created', False), ('id', True)], paginated.ordering)
+
+    def test_invalid_cursor_starts_over(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor', 'page_size': 2})
+        self.assertEqual(2, len(json.loads(response.content)))
+
+
+class PaginationCountStrategyTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.source = Source.objects.create(user=self.user, feed_url='http://test1.com/rss')
+        Post.ingest(self.source, [{'uuid': str(i), 'body': 'body'} for i in range(5)])
+
+    def _paginate(self, count_strategy, **params):
+        request = Request(APIRequestFactory().get('/', dict(page_size=2, **params)))
+        request.user = self.user
+        return PageNumberPagination(Post.objects.filter(source=self.source), request,
+                                    count_strategy=count_strategy)
+
+    def test_cached_count(self):
+        self.assertEqual(5, self._paginate(PageNumberPagination.COUNT_CACHED).get_total_count())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(5, self._paginate(PageNumberPagination.COUNT_CACHED).get_total_count())
+        self.assertEqual(0, len(queries))
+
+        Post.objects.create(source=self.source, body='body')
+        self.assertEqual(6, self._paginate(PageNumberPagination.COUNT_CACHED).get_total_count())
+        Post.ingest(self.source, [{'uuid': 'new', 'body': 'body'}])
+        self.assertEqual(7, self._paginate(PageNumberPagination.COUNT_CACHED).get_total_count())
+
+    def test_unpaginated_models_keep_fast_delete(self):
+        for model in (FetchLog, TimelineEntry, PostInteraction, RevokedToken):
+            self.assertTrue(Collector(using='default').can_fast_delete(model.objects.all()), model)
+
+    def test_deleting_posts_invalidates_once(self):
+        self.assertEqual(5, self._paginate(PageNumberPagination.COUNT_CACHED).get_total_count())
+        Post.objects.filter(source=self.source).first().delete()
+        self.assertEqual(4, self._paginate(PageNumberPagination.COUNT_CACHED).get_total_count())
+
+        pk = self.source.pk
+        with mock.patch('feed.models.invalidate_count_cache', wraps=invalidate_count_cache) as invalidate:
+            self.source.delete()
+        invalidate.assert_called_once_with(Post)
+        # the cached count of the same query is gone
+        self.source.pk = pk
+        self.assertEqual(0, self._paginate(PageNumberPagination.COUNT_CACHED).get_total_count())
+
+    def test_approximate_count_falls_back_to_exact(self):
+        self.assertEqual(5, self._paginate(PageNumberPagination.COUNT_APPROXIMATE).get_total_count())
+
+    def test_no_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            paginated = self._paginate(PageNumberPagination.COUNT_NONE, page=2)
+            self.assertEqual(2, len(paginated.get_result()))
+            headers = paginated.get_pagination_headers()
+        self.assertEqual(1, len(queries))
+        self.assertNotIn('X-Pagination-Total-Count', headers)
+        self.assertIn('rel=next', headers['Link'])
+        self.assertNotIn('rel=last', headers['Link'])
+
+        paginated = self._paginate(PageNumberPagination.COUNT_NONE, page=3)
+        self.assertEqual(1, len(paginated.get_result()))
+        self.assertNotIn('rel=next', paginated.get_pagination_headers()['Link'])
+
+
+class QueryCountTestCase(QueryCountTestMixin, APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        for i in range(20):
+            Source.subscribe(self.user, 'http://test{}.com/rss'.format(i))
+        self.source = self.user.sources.first()
+        Post.ingest(Source.objects.get(pk=self.source.feed_id),
+                    [{'uuid': str(i), 'body': 'body'} for i in range(20)])
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+
+    def test_source_list(self):
+        self.assertConstantQueries(reverse('source_list'))
+
+    def test_post_list(self):
+        self.assertConstantQueries(reverse('post_list', kwargs={'pk': self.source.pk}))
+        self.assertConstantQueries(reverse('post_list', kwargs={'pk': self.source.pk}), cursor='')
+
+
+class PostUrlObjectTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.other_user = CustomUser.objects.create_user(
+            email='arya@stark.com', password='valar_morghulis', cellphone='09123456780')
+        self.source = Source.subscribe(self.user, 'http://test1.com/rss')
+        self.url = reverse('post_list', kwargs={'pk': self.source.pk})
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+
+    def test_create_resolves_source_once(self):
+        legacy = Source.objects.create(user=self.user, feed_url='http://test2.com/rss')
+        url = reverse('post_list', kwargs={'pk': legacy.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'title': 'title', 'body': 'body'})
+
+        self.assertEqual(201, response.status_code)
+        source_queries = [q for q in queries if 'FROM "feed_source"' in q['sql']]
+        self.assertEqual(1, len(source_queries))
+        self.assertEqual(legacy.pk, Post.objects.get().source_id)
+
+    def test_shared_posts_read_only(self):
+        post = Post.objects.create(source=self.source.feed, title='title', body='body',
+                                   uuid='1', created=datetime.datetime.now())
+        url = reverse('post_detail', kwargs={'pk': self.source.pk, 'post_id': post.pk})
+
+        self.assertEqual(403, self.client.post(self.url, {'title': 'spam', 'body': 'spam'}).status_code)
+        self.assertEqual(403, self.client.put(url, {'title': 'title', 'body': 'defaced'}).status_code)
+        self.assertEqual(403, self.client.delete(url).status_code)
+
+        post.refresh_from_db()
+        self.assertEqual('body', post.body)
+        self.assertEqual(1, Post.objects.count())
+
+        favorite = reverse('post_favorite', kwargs={'pk': self.source.pk, 'post_id': post.pk})
+        self.assertEqual(204, self.client.patch(favorite).status_code)
+        self.assertEqual(204, self.client.delete(favorite).status_code)
+
+    def test_other_users_source_not_found(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.other_user.get_new_auth_token())
+
+        self.assertEqual(404, self.client.get(self.url).status_code)
+        self.assertEqual(404, self.client.post(self.url, {'body': 'body'}).status_code)
+        self.assertEqual(0, Post.objects.count())
+
+
+class TokenCacheTestCase(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.token = self.user.get_new_auth_token()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token)
+        self.url = reverse('source_list')
+
+    def _auth_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, [q for q in queries if 'common_jwttoken' in q['sql']]
+
+    def test_cached_authentication(self):
+        response, queries = self._auth_queries()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(queries))
+
+        response, queries = self._auth_queries()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(0, len(queries))
+
+    def test_revoke_invalidates(self):
+        self._auth_queries()
+        JwtToken.revoke(jwt_decode_handler(self.token))
+        self.assertEqual(401, self.client.get(self.url).status_code)
+
+    def test_deactivation_invalidates(self):
+        self._auth_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(401, self.client.get(self.url).status_code)
+
+
+@override_settings(TOKEN_AUTH=dict(settings.TOKEN_AUTH, MODE='stateless'))
+class StatelessAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        revocation_denylist.clear()
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789',
+            first_name='john')
+        self.token = self.user.get_new_auth_token()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token)
+        self.url = reverse('source_list')
+
+    def test_get_without_auth_queries(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        self.assertFalse([q for q in queries if 'FROM "common_' in q['sql']])
+
+    def test_deferred_user_fields(self):
+        user = CustomTokenAuthentication().authenticate_credentials(jwt_decode_handler(self.token))
+        self.assertEqual(self.user.pk, user.pk)
+        self.assertEqual('john', user.first_name)
+
+    def test_logout_revokes(self):
+        self.assertEqual(200, self.client.get(self.url).status_code)
+        self.user.logout(jwt_decode_handler(self.token))
+        self.assertEqual(401, self.client.get(self.url).status_code)
+        self.assertEqual(1, RevokedToken.objects.count())
+
+
+    def test_revocations_committed_out_of_order(self):
+        expires_at = datetime.datetime.now() + datetime.timedelta(days=1)
+        RevokedToken.objects.create(id=10, value='later', expires_at=expires_at)
+        revocation_denylist.refresh()
+        self.assertTrue(revocation_denylist.is_revoked('later'))
+
+        RevokedToken.objects.create(id=5, value='earlier', expires_at=expires_at)
+        revocation_denylist.refresh()
+        self.assertTrue(revocation_denylist.is_revoked('earlier'))
+
+
+class ThreadPoolASGIHandlerTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.source = Source.subscribe(self.user, 'http://test1.com/rss')
+        self.token = self.user.get_new_auth_token()
+        self.handler = ThreadPoolASGIHandler(max_workers=4)
+
+    def _request(self, path, method='GET'):
+        return ASGIRequest({
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': b'',
+            'headers': [(b'authorization', ('Bearer ' + self.token).encode())],
+        }, io.BytesIO())
+
+    def test_is_pooled(self):
+        self.assertTrue(self.handler.is_pooled(self._request(reverse('source_list'))))
+        self.assertTrue(self.handler.is_pooled(self._request(
+            reverse('post_detail', kwargs={'pk': self.source.pk, 'post_id': 1}))))
+        self.assertFalse(self.handler.is_pooled(self._request(reverse('source_list'), 'POST')))
+        self.assertFalse(self.handler.is_pooled(self._request('/not-found/')))
+
+    def test_pooled_response(self):
+        response = async_to_sync(self.handler.get_response_async)(
+            self._request(reverse('source_list')))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(json.loads(response.content)))
+
+
+class TimelineTestCase(QueryCountTestMixin, APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.other_user = CustomUser.objects.create_user(
+            email='arya@stark.com', password='valar_morghulis', cellphone='09123456780')
+        now = datetime.datetime.now()
+        for i in range(3):
+            source = Source.subscribe(self.user, 'http://test{}.com/rss'.format(i))
+            Post.ingest(source.feed, [{
+                'uuid': str(j), 'body': 'body', 'created': now - datetime.timedelta(minutes=i + 3 * j),
+            } for j in range(4)])
+        legacy = Source.objects.create(user=self.user, feed_url='http://legacy.com/rss')
+        Post.ingest(legacy, [{'uuid': 'legacy', 'body': 'body', 'created': now}])
+        other = Source.subscribe(self.other_user, 'http://other.com/rss')
+        Post.ingest(other.feed, [{'uuid': 'other', 'body': 'body', 'created': now}])
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+
+    def test_timeline(self):
+        response = self.client.get(reverse('timeline'), {'page_size': 20})
+        self.assertEqual(200, response.status_code)
+        posts = json.loads(response.content)
+
+        self.assertEqual(13, len(posts))
+        self.assertNotIn('other', [post['uuid'] for post in posts])
+        created = [post['created'] for post in posts]
+        self.assertEqual(sorted(created, reverse=True), created)
+
+    def test_timeline_query_count(self):
+        self.assertConstantQueries(reverse('timeline'))
+
+
+class MaterializedTimelineTestCase(TimelineTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.materialized_timeline = True
+        self.user.save()
+        TimelineEntry.rebuild(self.user)
+
+    def test_rebuild(self):
+        self.assertEqual(13, TimelineEntry.objects.filter(user=self.user).count())
+        self.assertFalse(TimelineEntry.objects.filter(user=self.other_user).exists())
+
+    def test_fan_out_on_ingest(self):
+        feed = Source.objects.get(user=None, url_key='http://test0.com/rss')
+        Post.ingest(feed, [{'uuid': 'new', 'body': 'body',
+                            'created': datetime.datetime.now() + datetime.timedelta(hours=1)}])
+
+        posts = json.loads(self.client.get(reverse('timeline')).content)
+        self.assertEqual('new', posts[0]['uuid'])
+        self.assertEqual(14, TimelineEntry.objects.filter(user=self.user).count())
+
+    def test_fan_out_skips_other_users(self):
+        feed = Source.objects.get(user=None, url_key='http://other.com/rss')
+        Post.ingest(feed, [{'uuid': 'new', 'body': 'body'}])
+
+        self.assertEqual(13, TimelineEntry.objects.filter(user=self.user).count())
+        self.assertFalse(TimelineEntry.objects.filter(user=self.other_user).exists())
+
+    @override_settings(FEED_TIMELINE={'MAX_LENGTH': 5})
+    def test_trim(self):
+        feed = Source.objects.get(user=None, url_key='http://test0.com/rss')
+        Post.ingest(feed, [{'uuid': 'new', 'body': 'body',
+                            'created': datetime.datetime.now() + datetime.timedelta(hours=1)}])
+
+        entries = TimelineEntry.objects.filter(user=self.user).order_by('-created')
+        self.assertEqual(14, entries.count())
+        self.assertEqual(0, TimelineEntry.trim([self.other_user.pk]))
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('trim_timelines', stdout=io.StringIO())
+        self.assertEqual(1, len(queries))
+        self.assertEqual(5, entries.count())
+        self.assertEqual('new', entries[0].post.uuid)
+
+    def test_walk_pages(self):
+        ids, url, params = [], reverse('timeline'), {'page_size': 5}
+        while url:
+            response = self.client.get(url, params)
+            ids += [post['id'] for post in json.loads(response.content)]
+            next_links = [link for link in response['Link'].split(', ') if 'rel=next' in link]
+            url = next_links[0][1:next_links[0].index('>')] if next_links else None
+            params = {}
+        self.assertEqual(13, len(ids))
+        self.assertEqual(13, len(set(ids)))
+
+    def test_unsubscribe(self):
+        Source.objects.get(user=self.user, url_key='http://test0.com/rss').delete()
+
+        self.assertEqual(9, TimelineEntry.objects.filter(user=self.user).count())
+
+    def test_unsubscribe_queryset(self):
+        Source.objects.filter(user=self.user, url_key='http://test0.com/rss').delete()
+
+        self.assertEqual(9, TimelineEntry.objects.filter(user=self.user).count())
+
+    def test_merge_drops_left_behind_posts(self):
+        feed = Source.objects.get(user=None, url_key='http://test0.com/rss')
+        target = Source.get_canonical('http://test9.com/rss')
+        Post.ingest(target, [{'uuid': '0', 'body': 'body'}])
+
+        feed.merge_into(target)
+
+        self.assertEqual(12, TimelineEntry.objects.filter(user=self.user).count())
+        self.assertFalse(TimelineEntry.objects.filter(post__source=feed).exists())
+
+
+class ReadStateTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.source = Source.subscribe(self.user, 'http://test.com/rss')
+        self.other = Source.subscribe(self.user, 'http://other.com/rss')
+        self.posts = Post.ingest(self.source.feed, [
+            {'uuid': str(i), 'body': 'body'} for i in range(5)])
+        Post.ingest(self.other.feed, [{'uuid': 'other', 'body': 'body'}])
+        self.post_ids = list(Post.objects.filter(
+            source=self.source.feed).order_by('id').values_list('id', flat=True))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+
+    def get_counts(self):
+        response = self.client.get(reverse('source_unread_counts'))
+        self.assertEqual(200, response.status_code)
+        return {item['source_id']: item['unread'] for item in json.loads(response.content)}
+
+    def test_unread_counts(self):
+        self.assertEqual({self.source.pk: 5, self.other.pk: 1}, self.get_counts())
+
+    def test_unread_counts_single_query(self):
+        with CaptureQueriesContext(connection) as context:
+            ReadState.get_unread_counts(self.user)
+        self.assertEqual(1, len(context.captured_queries))
+
+    def test_mark_post_read(self):
+        url = reverse('post_read', kwargs={'pk': self.source.pk, 'post_id': self.post_ids[2]})
+        self.assertEqual(204, self.client.patch(url).status_code)
+        self.assertEqual(4, self.get_counts()[self.source.pk])
+
+        self.assertEqual(204, self.client.delete(url).status_code)
+        self.assertEqual(5, self.get_counts()[self.source.pk])
+
+    def test_mark_all_read(self):
+        url = reverse('source_read', kwargs={'pk': self.source.pk})
+        self.assertEqual(204, self.client.put(url).status_code)
+        self.assertEqual({self.source.pk: 0, self.other.pk: 1}, self.get_counts())
+
+        ReadState.mark(self.source, [self.post_ids[0]], read=False)
+        self.assertEqual(1, self.get_counts()[self.source.pk])
+
+        Post.ingest(self.source.feed, [{'uuid': 'new', 'body': 'body'}])
+        self.assertEqual(2, self.get_counts()[self.source.pk])
+
+    def test_mark_all_read_stops_at_source(self):
+        Post.objects.create(id=self.post_ids[-1] + 100, source=self.other.feed, title='',
+                            body='', uuid='ahead', created=datetime.datetime.now())
+        ReadState.mark_all_read(self.source)
+        # committed after the mark with a lower id than the other source's post
+        Post.objects.create(id=self.post_ids[-1] + 50, source=self.source.feed, title='',
+                            body='', uuid='late', created=datetime.datetime.now())
+
+        self.assertEqual(self.post_ids[-1], self.source.read_state.read_up_to)
+        self.assertEqual(1, self.get_counts()[self.source.pk])
+
+    def test_mark_all_read_is_constant(self):
+        ReadState.mark_all_read(self.source)
+        with CaptureQueriesContext(connection) as context:
+            ReadState.mark_all_read(self.source)
+        Post.ingest(self.source.feed, [{'uuid': str(i), 'body': 'body'} for i in range(5, 500)])
+        with CaptureQueriesContext(connection) as more_posts_context:
+            ReadState.mark_all_read(self.source)
+        self.assertEqual(len(context.captured_queries), len(more_posts_context.captured_queries))
+
+    @override_settings(FEED_READ_STATE={'MAX_EXCEPTIONS': 2})
+    def test_compact(self):
+        state = ReadState.mark(self.source, self.post_ids[:3])
+
+        self.assertEqual(self.post_ids[2], state.read_up_to)
+        self.assertEqual('', state.exceptions)
+        self.assertTrue(state.is_read(self.post_ids[1]))
+        self.assertFalse(state.is_read(self.post_ids[3]))
+
+    def test_other_users_source(self):
+        other_user = CustomUser.objects.create_user(
+            email='arya@stark.com', password='valar_morghulis', cellphone='09123456780')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + other_user.get_new_auth_token())
+
+        response = self.client.put(reverse('source_read', kwargs={'pk': self.source.pk}))
+        self.assertEqual(404, response.status_code)
+        self.assertFalse(ReadState.objects.exists())
+
+
+class PostInteractionTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.other_user = CustomUser.objects.create_user(
+            email='arya@stark.com', password='valar_morghulis', cellphone='09123456780')
+        self.source = Source.subscribe(self.user, 'http://test.com/rss')
+        self.other_source = Source.subscribe(self.other_user, 'http://test.com/rss')
+        Post.ingest(self.source.feed, [{'uuid': str(i), 'body': 'body'} for i in range(3)])
+        self.post_ids = list(Post.objects.order_by('id').values_list('id', flat=True))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+
+    def get_posts(self):
+        response = self.client.get(reverse('post_list', kwargs={'pk': self.source.pk}))
+        return {post['id']: post for post in json.loads(response.content)}
+
+    def test_like_is_per_user(self):
+        url = reverse('post_favorite', kwargs={'pk': self.source.pk, 'post_id': self.post_ids[0]})
+        self.assertEqual(204, self.client.patch(url).status_code)
+
+        self.assertTrue(self.get_posts()[self.post_ids[0]]['is_liked'])
+        self.assertIsNone(self.get_posts()[self.post_ids[1]]['is_liked'])
+        self.assertFalse(PostInteraction.objects.filter(user=self.other_user).exists())
+
+        self.assertEqual(204, self.client.delete(url).status_code)
+        self.assertFalse(self.get_posts()[self.post_ids[0]]['is_liked'])
+        self.assertEqual(1, PostInteraction.objects.count())
+
+    def test_like_does_not_write_post(self):
+        post = Post.objects.get(pk=self.post_ids[0])
+        with CaptureQueriesContext(connection) as context:
+            post.like(self.user)
+            post.like(self.user)
+        self.assertFalse([query for query in context.captured_queries
+                          if 'UPDATE "feed_post"' in query['sql']])
+
+    def test_batch(self):
+        response = self.client.post(reverse('interactions'), {'actions': [
+            {'post_id': self.post_ids[0], 'action': 'like'},
+            {'post_id': self.post_ids[0], 'action': 'bookmark'},
+            {'post_id': self.post_ids[1], 'action': 'like'},
+            {'post_id': self.post_ids[1], 'action': 'unlike'},
+            {'post_id': self.post_ids[2], 'action': 'read'},
+            {'post_id': 0, 'action': 'like'},
+        ]}, format='json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([0], json.loads(response.content)['skipped'])
+
+        posts = self.get_posts()
+        self.assertTrue(posts[self.post_ids[0]]['is_liked'])
+        self.assertTrue(posts[self.post_ids[0]]['is_bookmarked'])
+        self.assertFalse(posts[self.post_ids[1]]['is_liked'])
+        self.assertIsNone(posts[self.post_ids[2]]['is_liked'])
+        self.assertTrue(ReadState.objects.get(source=self.source).is_read(self.post_ids[2]))
+        self.assertEqual(2, ReadState.get_unread_counts(self.user)[self.source.pk])
+
+    def test_batch_updates_existing(self):
+        self.client.post(reverse('interactions'), {'actions': [
+            {'post_id': self.post_ids[0], 'action': 'like'},
+        ]}, format='json')
+        self.client.post(reverse('interactions'), {'actions': [
+            {'post_id': self.post_ids[0], 'action': 'bookmark'},
+        ]}, format='json')
+
+        interaction = PostInteraction.objects.get(user=self.user)
+        self.assertTrue(interaction.is_liked)
+        self.assertTrue(interaction.is_bookmarked)
+
+    def test_batch_not_followed(self):
+        Source.objects.get(pk=self.source.pk).delete()
+        response = self.client.post(reverse('interactions'), {'actions': [
+            {'post_id': self.post_ids[0], 'action': 'like'},
+        ]}, format='json')
+
+        self.assertEqual([self.post_ids[0]], json.loads(response.content)['skipped'])
+        self.assertFalse(PostInteraction.objects.exists())
+
+    def test_batch_invalid_action(self):
+        response = self.client.post(reverse('interactions'), {'actions': [
+            {'post_id': self.post_ids[0], 'action': 'share'},
+        ]}, format='json')
+        self.assertEqual(400, response.status_code)
+
+
+class PostSearchTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.source = Source.subscribe(self.user, 'http://test.com/rss')
+        Post.ingest(self.source.feed, [
+            {'uuid': '1', 'title': 'Winter is coming', 'body': 'The north remembers'},
+            {'uuid': '2', 'title': 'Winter', 'body': 'winter winter winter'},
+            {'uuid': '3', 'title': 'Summer', 'body': 'Dragons'},
+        ])
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+
+    def search(self, text):
+        response = self.client.get(reverse('post_list', kwargs={'pk': self.source.pk}),
+                                   {'search': text})
+        self.assertEqual(200, response.status_code)
+        return [post['uuid'] for post in json.loads(response.content)]
+
+    def test_search_is_ranked(self):
+        self.assertEqual(['2', '1'], self.search('winter'))
+        self.assertEqual(['1'], self.search('winter north'))
+
+    def test_search_prefix(self):
+        self.assertEqual(['3'], self.search('drag'))
+
+    def test_search_uses_index(self):
+        with CaptureQueriesContext(connection) as context:
+            self.search('winter')
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertIn('feed_post_fts', sql)
+        self.assertNotIn('LIKE', sql)
+
+    def test_index_follows_writes(self):
+        Post.ingest(self.source.feed, [{'uuid': '4', 'title': 'Night', 'body': 'The long night'}])
+        self.assertEqual(['4'], self.search('night'))
+
+        post = Post.objects.get(uuid='4')
+        post.title, post.body = 'Day', 'Sunrise'
+        post.save()
+        self.assertEqual([], self.search('night'))
+        self.assertEqual(['4'], self.search('sunrise'))
+
+        Post.objects.filter(uuid='4').delete()
+        self.assertEqual([], self.search('sunrise'))
+
+    def test_search_syntax_is_escaped(self):
+        self.assertEqual([], self.search('"winter" OR (NEAR'))
+
+    def test_search_fallback(self):
+        with mock.patch.object(Post.get_search_index(), 'is_available', return_value=False):
+            self.assertEqual(['1'], sorted(self.search('coming')))
+
+
+class PersianNormalizationTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.source = Source.subscribe(self.user, 'http://test.com/rss', name='كتاب ي ١٢')
+        Source.subscribe(self.user, 'http://other.com/rss', name='other')
+        Post.ingest(self.source.feed, [{'uuid': '1', 'title': 'مقالهِ علمي', 'body': 'body'}])
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+
+    def test_normalize_persian(self):
+        self.assertEqual('کتاب ی ۱۲', normalize_persian('كتاب ي ١٢'))
+        self.assertEqual('مقاله', normalize_persian('مقالهِ'))
+        self.assertIsNone(normalize_persian(None))
+
+    def test_normalized_on_write(self):
+        self.assertEqual('کتاب ی ۱۲', Source.objects.get(pk=self.source.pk).name_normalized)
+        self.assertEqual('مقاله علمی', Post.objects.get(uuid='1').title_normalized)
+
+        self.source.name = 'ي'
+        self.source.save()
+        self.assertEqual('ی', Source.objects.get(pk=self.source.pk).name_normalized)
+
+    def test_filter_uses_normalized_column(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('source_list'), {'exact__name': 'کتاب ی ۱۲'})
+        sources = json.loads(response.content)
+        self.assertEqual([self.source.pk], [source['id'] for source in sources])
+        self.assertNotIn('name_normalized', sources[0])
+        self.assertTrue([query for query in context.captured_queries
+                         if '"name_normalized" =' in query['sql']])
+
+    def test_filter_value_is_normalized(self):
+        response = self.client.get(reverse('source_list'), {'filter__name': 'كتاب'})
+        self.assertEqual([self.source.pk], [source['id'] for source in json.loads(response.content)])
+
+    def test_search_is_normalized(self):
+        response = self.client.get(reverse('post_list', kwargs={'pk': self.source.pk}),
+                                   {'search': 'علمي'})
+        self.assertEqual(['1'], [post['uuid'] for post in json.loads(response.content)])
+
+
+class PaginationPlanTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        for i, name in enumerate(['b', 'a', 'c']):
+            Source.objects.create(user=self.user, feed_url='http://test{}.com/rss'.format(i),
+                                  name=name, interval=i % 2)
+
+    def _paginate(self, **params):
+        request = Request(APIRequestFactory().get('/', params))
+        return PageNumberPagination(Source.objects.all(), request,
+                                    filterable_fields=['name', 'interval', 'user__email'],
+                                    sortable_fields=['name', 'interval'])
+
+    def test_plan_is_reused(self):
+        self.assertIs(self._paginate().plan, self._paginate(filter__name='a').plan)
+
+    def test_overhead_does_not_grow_with_params(self):
+        self._paginate()
+        options = type(Source._meta)
+        params = {'param_{}'.format(i): 'value' for i in range(50)}
+        with mock.patch.object(PaginationPlan, '__init__', side_effect=AssertionError), \
+                mock.patch.object(options, 'get_field', autospec=True,
+                                  side_effect=options.get_field) as get_field:
+            self._paginate(filter__name='a', exact__interval='1')
+            calls = get_field.call_count
+            self._paginate(filter__name='a', exact__interval='1', **params)
+            self.assertEqual(calls * 2, get_field.call_count)
+
+    def test_filters(self):
+        self.assertEqual(['a'], [source.name for source in self._paginate(filter__name='A').get_result()])
+        self.assertEqual(['a'], [source.name for source in self._paginate(exact__interval='1').get_result()])
+        self.assertEqual(3, len(self._paginate(exact__user__email='john@snow.com').get_result()))
+        self.assertEqual(3, len(self._paginate(exact__unknown='1').get_result()))
+
+    def test_multiple_sort_fields(self):
+        result = self._paginate(sort='interval,-name,unknown').get_result()
+        self.assertEqual(['c', 'b', 'a'], [source.name for source in result])
+
+
+def rss_items(count, body_size=10, start=0):
+    for i in range(start, start + count):
+        date = datetime.datetime(2020, 1, 1) - datetime.timedelta(hours=i)
+        yield ('<item><guid>{}</guid><title>Item {}</title><description>{}</description>'
+               '<pubDate>{}</pubDate></item>').format(
+            i, i, 'x' * body_size, date.strftime('%a, %d %b %Y %H:%M:%S GMT')).encode()
+
+
+def rss_chunks(count, body_size=10, start=0):
+    yield b'<?xml version="1.0"?><rss version="2.0"><channel><title>Test</title>'
+    yield from rss_items(count, body_size, start)
+    yield b'</channel></rss>'
+
+
+class StreamingParserTestCase(TestCase):
+    def test_chunked_input(self):
+        chunks = [RSS_FEED[i:i + 7] for i in range(0, len(RSS_FEED), 7)]
+        self.assertEqual(parse_feed(RSS_FEED), list(iter_entries(chunks)))
+        self.assertEqual(['1', '2'], [entry['uuid'] for entry in parse_feed(RSS_FEED)])
+
+    def test_limits(self):
+        self.assertEqual(['0', '1'], [entry['uuid'] for entry in iter_entries(
+            rss_chunks(5), stop_uuid='2')])
+        self.assertEqual(3, len(list(iter_entries(rss_chunks(5), max_entries=3))))
+        self.assertEqual(4, len(list(iter_entries(rss_chunks(5), max_body_size=4))[0]['body']))
+
+    def test_parse_error(self):
+        with self.assertRaises(FeedParseError):
+            list(iter_entries([b'<rss><channel><item>']))
+        with self.assertRaises(FeedParseError):
+            list(iter_entries([b'not xml']))
+
+    def test_memory_is_bounded(self):
+        tracemalloc.start()
+        try:
+            count = 0
+            for entry in iter_entries(rss_chunks(5000, body_size=2000)):
+                count += 1
+            size, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(5000, count)
+        # the document is over 10MB
+        self.assertLess(peak, 1024 * 1024)
+
+    def test_poll_stops_at_last_seen_entry(self):
+        user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        source = Source.objects.create(user=user, feed_url='http://test1.com/rss')
+        feed = b''.join(rss_chunks(10, start=1))
+        with mock.patch('requests.Session.get', return_value=mock_response(content=feed)):
+            Poller(workers=2).poll_batch()
+        source.refresh_from_db()
+        self.assertEqual('1', source.last_uuid)
+
+        Source.objects.filter(pk=source.pk).update(due_poll=datetime.datetime(1900, 1, 1))
+        feed = b''.join(rss_chunks(11, start=-1))
+        with mock.patch('requests.Session.get', return_value=mock_response(content=feed)), \
+                mock.patch('feed.models.Post.ingest', wraps=Post.ingest) as ingest:
+            Poller(workers=2).poll_batch()
+
+        self.assertEqual(['-1', '0'], [entry['uuid'] for entry in ingest.call_args[0][1]])
+        source.refresh_from_db()
+        self.assertEqual('-1', source.last_uuid)
+        self.assertEqual(12, source.posts.count())
+
+    def test_single_new_entry_moves_last_uuid(self):
+        user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        source = Source.objects.create(user=user, feed_url='http://test1.com/rss')
+        for start in (2, 1, 0):
+            Source.objects.filter(pk=source.pk).update(due_poll=datetime.datetime(1900, 1, 1))
+            feed = b''.join(rss_chunks(5, start=start))
+            with mock.patch('requests.Session.get', return_value=mock_response(content=feed)), \
+                    mock.patch('feed.models.Post.ingest', wraps=Post.ingest) as ingest:
+                Poller(workers=2).poll_batch()
+            source.refresh_from_db()
+            self.assertEqual(str(start), source.last_uuid)
+        self.assertEqual(['0'], [entry['uuid'] for entry in ingest.call_args[0][1]])
+
+    def test_newest_uuid(self):
+        now = datetime.datetime.now()
+        newer = {'uuid': 'newer', 'created': now}
+        older = {'uuid': 'older', 'created': now - datetime.timedelta(hours=1)}
+        undated = {'uuid': 'undated', 'created': None}
+        self.assertEqual('newer', get_newest_uuid([newer, older], 'last'))
+        self.assertIsNone(get_newest_uuid([older, newer], 'last', True))
+        self.assertEqual('newer', get_newest_uuid([newer], 'last', True))
+        self.assertEqual('last', get_newest_uuid([newer], 'last'))
+        self.assertEqual('last', get_newest_uuid([newer, undated], 'last'))
+
+    def test_poll_parse_error(self):
+        user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        source = Source.objects.create(user=user, feed_url='http://test1.com/rss')
+        with mock.patch('requests.Session.get', return_value=mock_response(content=b'<rss>')):
+            Poller(workers=2).poll_batch()
+
+        source.refresh_from_db()
+        self.assertTrue(source.last_result.startswith('Parse error'))
+        self.assertIsNone(source.last_success)
+
+
+class HostPoolTestCase(TestCase):
+    def test_interleave_by_host(self):
+        sources = [Source(feed_url=url) for url in (
+            'http://a.com/1', 'http://a.com/2', 'http://a.com/3', 'http://b.com/1', 'https://c.com/1')]
+        self.assertEqual(
+            ['http://a.com/1', 'http://b.com/1', 'https://c.com/1', 'http://a.com/2'],
+            [source.feed_url for source in interleave_by_host(sources, limit=2)])
+
+    def test_session_per_host(self):
+        pool = HostPool(concurrency=2, delay=0, user_agent='test', max_hosts=2)
+        with pool.acquire('http://a.com/1') as first, pool.acquire('http://A.com/2') as second:
+            self.assertIs(first, second)
+        with pool.acquire('http://b.com/1') as other:
+            self.assertIsNot(first, other)
+
+        with mock.patch.object(first, 'close') as close:
+            with pool.acquire('http://c.com/1'):
+                pass
+        close.assert_called_once()
+        pool.close()
+
+    def test_politeness(self):
+        pool = HostPool(concurrency=2, delay=0.05, user_agent='test', max_hosts=10)
+        lock = threading.Lock()
+        starts, active, max_active = [], [0], [0]
+
+        def request(i):
+            with pool.acquire('http://a.com/{}'.format(i)):
+                with lock:
+                    starts.append(time.monotonic())
+                    active[0] += 1
+                    max_active[0] = max(max_active[0], active[0])
+                time.sleep(0.1)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(2, max_active[0])
+        starts.sort()
+        self.assertTrue(all(later - earlier >= 0.045 for earlier, later in zip(starts, starts[1:])))
+        pool.close()
+
+    def test_lease_covers_host_queue(self):
+        poller = Poller(workers=32, timeout=20)
+        try:
+            one_host = [Source(feed_url='http://a.com/{}'.format(i)) for i in range(20)]
+            many_hosts = [Source(feed_url='http://{}.com/rss'.format(i)) for i in range(20)]
+            # 10 rounds of 2 requests on one host against a single round
+            self.assertGreaterEqual(poller.get_lease(one_host), 10 * 20 + 20 * 0.5)
+            self.assertLess(poller.get_lease(many_hosts), poller.get_lease(one_host) / 5)
+
+            user = CustomUser.objects.create_user(
+                email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+            for source in one_host:
+                source.user = user
+                source.save()
+            now = datetime.datetime.now()
+            poller.claim(one_host, now)
+        finally:
+            poller.close()
+        self.assertFalse(Source.objects.filter(
+            due_poll__lt=now + datetime.timedelta(seconds=poller.get_lease(one_host))).exists())
+
+    @override_settings(FEED_POLLER=dict(settings.FEED_POLLER, HOST_BATCH_LIMIT=1))
+    def test_due_sources_limited_per_host(self):
+        user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        for url in ('http://a.com/1', 'http://a.com/2', 'http://b.com/1'):
+            Source.objects.create(user=user, feed_url=url)
+
+        poller = Poller(workers=2)
+        try:
+            sources = poller.get_due_sources(datetime.datetime.now())
+        finally:
+            poller.close()
+        self.assertEqual(['http://a.com/1', 'http://b.com/1'], [source.feed_url for source in sources])
+
+
+class ProxyPoolTestCase(TestCase):
+    def setUp(self):
+        self.now = datetime.datetime.now()
+        self.fast = Proxy.objects.create(address='10.0.0.1:8080', latency=0.2)
+        self.slow = Proxy.objects.create(address='10.0.0.2:8080', latency=3.0)
+        self.evicted = Proxy.objects.create(address='10.0.0.3:8080',
+                                            evicted_until=self.now + datetime.timedelta(hours=1))
+
+    def _result(self, status_code=200, duration=0.1, error=None):
+        return FetchResult(None, status_code=status_code, duration=duration, error=error)
+
+    @override_settings(FEED_PROXIES=dict(settings.FEED_PROXIES, CHOICES=1))
+    def test_choose_fastest(self):
+        pool = ProxyPool()
+        pool.load(self.now)
+        self.assertEqual([self.fast, self.slow], sorted(pool.proxies, key=lambda proxy: proxy.pk))
+        self.assertEqual(self.fast, pool.choose())
+
+    def test_evict_failing(self):
+        pool = ProxyPool()
+        pool.load(self.now)
+        for i in range(3):
+            pool.record(self.fast, self._result(error='ProxyError'), self.now)
+        self.assertNotIn(self.fast, pool.proxies)
+        self.assertEqual(self.slow, pool.choose())
+
+        pool.save()
+        self.fast.refresh_from_db()
+        self.assertEqual(3, self.fast.requests)
+        self.assertEqual(3, self.fast.failures)
+        self.assertGreater(self.fast.error_rate, 0.5)
+        self.assertGreater(self.fast.evicted_until, self.now)
+
+        pool.load(self.now)
+        self.assertEqual([self.slow], pool.proxies)
+
+    def test_source_errors_not_held_against_proxy(self):
+        pool = ProxyPool()
+        pool.load(self.now)
+        for i in range(5):
+            pool.record(self.fast, self._result(status_code=0, error='ConnectionError'), self.now)
+            pool.record(self.fast, self._result(status_code=502), self.now)
+        self.assertIn(self.fast, pool.proxies)
+        self.assertEqual(0, self.fast.error_rate)
+        self.assertEqual(0, self.fast.failures)
+        self.assertEqual(10, self.fast.requests)
+        self.assertEqual(0.2, self.fast.latency)
+
+    def test_evict_slow(self):
+        pool = ProxyPool()
+        pool.load(self.now)
+        for i in range(5):
+            pool.record(self.slow, self._result(duration=9.0), self.now)
+        self.assertEqual([self.fast], pool.proxies)
+
+    def test_latency_ewma(self):
+        pool = ProxyPool()
+        pool.load(self.now)
+        pool.record(self.fast, self._result(duration=1.2), self.now)
+        self.assertAlmostEqual(0.2 + 0.3 * 1.0, self.fast.latency)
+        self.assertEqual(0, self.fast.error_rate)
+
+    def test_blocked_sources_use_proxy(self):
+        user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        blocked = Source.objects.create(user=user, feed_url='http://a.com/rss', is_cloud_flare=True)
+        direct = Source.objects.create(user=user, feed_url='http://b.com/rss')
+
+        with mock.patch('requests.Session.get', return_value=mock_response()) as get:
+            Poller(workers=1).poll_batch()
+
+        proxies = {call[0][0]: call[1]['proxies'] for call in get.call_args_list}
+        self.assertIsNone(proxies[direct.feed_url])
+        self.assertIn(proxies[blocked.feed_url]['https'], (self.fast.url, self.slow.url))
+        self.assertEqual(1, Proxy.objects.filter(requests=1).count())
+
+    def test_dead_sources_fetched_directly(self):
+        user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        source = Source.objects.create(user=user, feed_url='http://a.com/rss')
+
+        with mock.patch('requests.Session.get', side_effect=requests.ConnectionError) as get:
+            for i in range(2):
+                Source.objects.filter(pk=source.pk).update(due_poll=datetime.datetime(1900, 1, 1))
+                Poller(workers=1).poll_batch()
+
+        self.assertEqual([None, None], [call[1]['proxies'] for call in get.call_args_list])
+        self.assertFalse(Proxy.objects.filter(requests__gt=0).exists())
+
+        source.refresh_from_db()
+        self.assertIsNone(source.proxied_since)
+
+    def test_refused_sources_stay_on_proxies(self):
+        user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        source = Source.objects.create(user=user, feed_url='http://a.com/rss')
+        direct_status = [403]
+
+        def get(url, proxies=None, **kwargs):
+            if proxies is None:
+                return mock_response(status_code=direct_status[0])
+            return mock_response(status_code=304)
+
+        def poll():
+            Source.objects.filter(pk=source.pk).update(due_poll=datetime.datetime(1900, 1, 1))
+            with mock.patch('requests.Session.get', side_effect=get) as session_get:
+                Poller(workers=1).poll_batch()
+            source.refresh_from_db()
+            return session_get.call_args[1]['proxies'] is not None
+
+        self.assertEqual([False, True, True, True, True, True], [poll() for i in range(6)])
+        self.assertEqual(304, source.status_code)
+        self.assertIsNotNone(source.proxied_since)
+
+        # the direct probe is still refused
+        probe_after = datetime.timedelta(seconds=settings.FEED_PROXIES['PROBE_AFTER'])
+        Source.objects.filter(pk=source.pk).update(proxied_since=source.proxied_since - probe_after)
+        self.assertEqual([False, True], [poll(), poll()])
+
+        Source.objects.filter(pk=source.pk).update(proxied_since=source.proxied_since - probe_after)
+        direct_status[0] = 200
+        self.assertEqual([False, False], [poll(), poll()])
+        self.assertIsNone(source.proxied_since)
+
+    def test_detect_cloud_flare(self):
+        user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        source = Source.objects.create(user=user, feed_url='http://a.com/rss')
+        response = mock_response(status_code=503, headers={'Server': 'cloudflare'})
+
+        with mock.patch('requests.Session.get', return_value=response) as get:
+            Poller(workers=1).poll_batch()
+            source.refresh_from_db()
+            self.assertTrue(source.is_cloud_flare)
+            self.assertIsNone(get.call_args[1]['proxies'])
+
+            Source.objects.filter(pk=source.pk).update(due_poll=datetime.datetime(1900, 1, 1))
+            Poller(workers=1).poll_batch()
+            self.assertIsNotNone(get.call_args[1]['proxies'])
+
+
+class RedirectTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.subscription = Source.subscribe(self.user, 'http://old.com/rss')
+        self.feed = self.subscription.feed
+
+    def _poll(self, responses):
+        """
+        :param dict responses: url to response
+        """
+        Source.objects.filter(pk=self.feed.pk).update(due_poll=datetime.datetime(1900, 1, 1))
+        with mock.patch('requests.Session.get',
+                        side_effect=lambda url, **kwargs: responses[url]) as get:
+            Poller(workers=1).poll_batch()
+        self.feed.refresh_from_db()
+        return [call[0][0] for call in get.call_args_list]
+
+    def _redirect(self, status_code, location):
+        return mock_response(status_code, b'', headers={'Location': location})
+
+    def test_permanent_redirect(self):
+        urls = self._poll({
+            'http://old.com/rss': self._redirect(301, 'http://new.com/rss'),
+            'http://new.com/rss': mock_response(),
+        })
+        self.assertEqual(['http://old.com/rss', 'http://new.com/rss'], urls)
+        self.assertEqual('http://new.com/rss', self.feed.feed_url)
+        self.assertEqual('http://new.com/rss', self.feed.url_key)
+        self.assertEqual(2, self.feed.posts.count())
+
+        urls = self._poll({'http://new.com/rss': mock_response(status_code=304)})
+        self.assertEqual(['http://new.com/rss'], urls)
+
+    def test_collapse_chain(self):
+        self._poll({
+            'http://old.com/rss': self._redirect(301, 'https://old.com/rss'),
+            'https://old.com/rss': self._redirect(308, '/feed'),
+            'https://old.com/feed': mock_response(),
+        })
+        self.assertEqual('https://old.com/feed', self.feed.feed_url)
+
+    def test_redirect_to_error(self):
+        self._poll({
+            'http://old.com/rss': self._redirect(301, 'http://new.com/rss'),
+            'http://new.com/rss': mock_response(status_code=404),
+        })
+        self.assertEqual('http://old.com/rss', self.feed.feed_url)
+
+    def test_too_many_redirects(self):
+        self._poll({'http://old.com/rss': self._redirect(301, 'http://old.com/rss')})
+        self.assertEqual('TooManyRedirects', self.feed.last_result)
+        self.assertEqual('http://old.com/rss', self.feed.feed_url)
+
+    def test_temporary_redirect(self):
+        responses = {
+            'http://old.com/rss': self._redirect(302, 'http://tmp.com/rss'),
+            'http://tmp.com/rss': mock_response(status_code=304),
+        }
+        self._poll(responses)
+        self.assertEqual('http://old.com/rss', self.feed.feed_url)
+        self.assertEqual('http://tmp.com/rss', self.feed.last_302_url)
+        start = self.feed.last_302_start
+        self.assertIsNotNone(start)
+
+        self._poll(responses)
+        self.assertEqual('http://old.com/rss', self.feed.feed_url)
+        self.assertEqual(start, self.feed.last_302_start)
+
+        Source.objects.filter(pk=self.feed.pk).update(
+            last_302_start=start - datetime.timedelta(seconds=settings.FEED_POLLER['PROMOTE_REDIRECT_AFTER']))
+        self._poll(responses)
+        self.assertEqual('http://tmp.com/rss', self.feed.feed_url)
+        self.assertIsNone(self.feed.last_302_url)
+        self.assertIsNone(self.feed.last_302_start)
+
+    def test_temporary_redirect_moves(self):
+        self._poll({
+            'http://old.com/rss': self._redirect(307, 'http://a.com/rss'),
+            'http://a.com/rss': mock_response(status_code=304),
+        })
+        start = self.feed.last_302_start
+        self._poll({
+            'http://old.com/rss': self._redirect(307, 'http://b.com/rss'),
+            'http://b.com/rss': mock_response(status_code=304),
+        })
+        self.assertEqual('http://b.com/rss', self.feed.last_302_url)
+        self.assertGreater(self.feed.last_302_start, start)
+
+        self._poll({'http://old.com/rss': mock_response(status_code=304)})
+        self.assertIsNone(self.feed.last_302_url)
+        self.assertIsNone(self.feed.last_302_start)
+
+    def test_merge_into_existing_feed(self):
+        other_user = CustomUser.objects.create_user(
+            email='arya@stark.com', password='valar_morghulis', cellphone='09123456780')
+        other = Source.subscribe(other_user, 'http://new.com/rss').feed
+        Source.objects.filter(pk=other.pk).update(
+            due_poll=datetime.datetime.now() + datetime.timedelta(hours=1))
+        Post.objects.create(source=self.feed, title='shared', body='', uuid='shared',
+                            created=datetime.datetime.now())
+        Post.objects.create(source=other, title='shared', body='', uuid='shared',
+                            created=datetime.datetime.now())
+        Post.objects.create(source=self.feed, title='old', body='', uuid='old',
+                            created=datetime.datetime.now())
+
+        self._poll({
+            'http://old.com/rss': self._redirect(301, 'http://new.com/rss'),
+            'http://new.com/rss': mock_response(),
+        })
+        other.refresh_from_db()
+        self.subscription.refresh_from_db()
+        self.assertFalse(self.feed.live)
+        self.assertEqual(0, self.feed.num_subs)
+        self.assertEqual(2, other.num_subs)
+        self.assertEqual(other.pk, self.subscription.feed_id)
+        self.assertEqual(['shared'], list(self.feed.posts.values_list('uuid', flat=True)))
+        self.assertEqual({'shared', 'old'}, set(other.posts.values_list('uuid', flat=True)))
+
+
+class FetchLogTestCase(APITestCase):
+    url = reverse('source_fetch_stats')
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='john@snow.com', password='you_know_nothing', cellphone='09123456789')
+        self.feed = Source.subscribe(self.user, 'http://a.com/rss').feed
+
+    def _poll(self, response):
+        Source.objects.filter(pk=self.feed.pk).update(due_poll=datetime.datetime(1900, 1, 1))
+        with mock.patch('requests.Session.get', return_value=response):
+            Poller(workers=1).poll_batch()
+
+    def test_poll_logs(self):
+        self._poll(mock_response())
+        self._poll(mock_response(status_code=304))
+        self._poll(mock_response(status_code=500))
+
+        logs = list(self.feed.fetch_logs.order_by('id'))
+        self.assertEqual([200, 304, 500], [log.status_code for log in logs])
+        self.assertEqual([len(RSS_FEED), 0, 0], [log.size for log in logs])
+        self.assertEqual([2, 0, None], [log.new_posts for log in logs])
+        self.assertEqual([False, True, False], [log.not_modified for log in logs])
+
+        stats = self.feed.fetch_stats
+        self.assertEqual(3, stats.fetches)
+        self.assertEqual(1, stats.not_modified)
+        self.assertEqual(1, stats.failures)
+        self.assertEqual(2, stats.new_posts)
+        self.assertEqual(len(RSS_FEED), stats.total_bytes)
+        self.assertAlmostEqual(sum(log.duration for log in logs), stats.total_duration)
+        self.assertEqual(logs[-1].fetched_at, stats.last_fetched)
+
+    def test_prune(self):
+        now = datetime.datetime.now()
+        for days in (40, 31, 1):
+            FetchLog.record([FetchLog(source=self.feed, fetched_at=now - datetime.timedelta(days=days),
+                                      duration=1.0, new_posts=0)])
+
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('prune_fetch_log', stdout=out)
+        self.assertEqual(1, len(queries))
+        self.assertTrue(queries[0]['sql'].startswith('DELETE'))
+        self.assertIn('Deleted 2', out.getvalue())
+        self.assertEqual(1, self.feed.fetch_logs.count())
+        self.assertEqual(3, SourceFetchStats.objects.get(source=self.feed).fetches)
+
+    def test_ranking(self):
+        other = Source.subscribe(self.user, 'http://b.com/rss').feed
+        now = datetime.datetime.now()
+        FetchLog.record([
+            FetchLog(source=self.feed, fetched_at=now, duration=1.0, size=100, new_posts=2),
+            FetchLog(source=other, fetched_at=now, duration=3.0, size=10, new_posts=1),
+            FetchLog(source=other, fetched_at=now, duration=2.0, size=10, new_posts=None),
+        ])
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+        self.assertEqual(403, self.client.get(self.url).status_code)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.get_new_auth_token())
+        data = json.loads(self.client.get(self.url).content)
+        self.assertEqual([other.pk, self.feed.pk], [row['source'] for row in data])
+        self.assertEqual([5.0, 0.5], [row['duration_per_post'] for row in data])
+        self.assertEqual('http://b.com/rss', data[0]['feed_url'])
+
+        data = json.loads(self.client.get(self.url, {'sort': '-total_bytes'}).content)
+        self.assertEqual([self.feed.pk, other.pk], [row['source'] for row in data])
@@ -3,6 +3,12 @@ from django.urls import path, include
 from feed import views
 
 urlpatterns = [
+    path('timeline/', views.TimelineApiView.as_view({
+        'get': 'list',
+    }), name='timeline'
+         ),
+    path('interactions/', views.InteractionBatchApiView.as_view(),
+         name='interactions'),
     path('source/', include([
         path('', views.SourceApiView.as_view({
             'get': 'list',
@@ -10,6 +16,14 @@ urlpatterns = [
 
         }), name='source_list'
              ),
+        path('unread-counts/', views.SourceApiView.as_view({
+            'get': 'unread_counts',
+        }), name='source_unread_counts'
+             ),
+        path('fetch-stats/', views.SourceFetchStatsApiView.as_view({
+            'get': 'list',
+        }), name='source_fetch_stats'
+             ),
         path('<int:pk>/', include([
             path('', views.SourceApiView.as_view({
                 'get': 'retrieve',
@@ -18,6 +32,10 @@ urlpatterns = [
 
             }), name='source_detail'
                  ),
+            path('read/', views.SourceApiView.as_view({
+                'put': 'read',
+            }), name='source_read'
+                 ),
             path('post/', include([
                 path('', views.PostApiView.as_view({
                     'get': 'list',
@@ -37,6 +55,11 @@ urlpatterns = [
                         'delete': 'dislike',
                     }), name='post_favorite'
                          ),
+                    path('read/', views.PostApiView.as_view({
+                        'patch': 'read',
+                        'delete': 'unread',
+                    }), name='post_read'
+                         ),
 
                 ])),
 
@@ -1,12 +1,14 @@
 from rest_framework import status
-from rest_framework.exceptions import NotFound
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 
+from common import errors
 from common.auth import CustomTokenAuthentication
-from common.response import Response
-from common.views import PaginatedViewSet
-from feed.models import Post, Source
-from feed.serializers import SourceSerializer, PostSerializer
+from common.response import ErrorResponse, Response
+from common.views import BaseApiView, PaginatedViewSet
+from feed.models import Post, PostInteraction, ReadState, Source, SourceFetchStats, \
+    TimelineEntry
+from feed.serializers import SourceSerializer, PostSerializer, InteractionBatchSerializer, \
+    SourceFetchStatsSerializer
 
 
 class SourceApiView(PaginatedViewSet):
@@ -14,6 +16,7 @@ class SourceApiView(PaginatedViewSet):
 
     authentication_classes = (CustomTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    async_actions = ('list', 'retrieve', 'unread_counts')
 
     def get_queryset(self, request):
         return request.user.sources
@@ -23,38 +26,71 @@ class SourceApiView(PaginatedViewSet):
             'user': request.user
         }
 
+    def unread_counts(self, request):
+        return Response(data=[
+            {'source_id': source_id, 'unread': count}
+            for source_id, count in ReadState.get_unread_counts(request.user).items()
+        ])
+
+    def read(self, request, pk):
+        obj = self.get_queryset(request).filter(pk=pk).first()
+        if not obj:
+            return self.not_found(request)
+        ReadState.mark_all_read(obj)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SourceFetchStatsApiView(PaginatedViewSet):
+    """
+    Polled feeds ranked by the time spent fetching them, `sort` ranks them
+    by any other total instead
+    """
+    serializer_class = SourceFetchStatsSerializer
+    queryset = SourceFetchStats.objects.order_by('-total_duration', 'source_id')
+    eager_loading = (['source'], [])
+
+    authentication_classes = (CustomTokenAuthentication,)
+    permission_classes = (IsAdminUser,)
+
 
 class PostApiView(PaginatedViewSet):
     serializer_class = PostSerializer
 
     authentication_classes = (CustomTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    async_actions = ('list', 'retrieve')
     url_params = ['pk']
+    url_objects = {
+        'source': ('pk', Source.objects.select_related('feed'), 'user'),
+    }
+    cursor_ordering = ['-created', '-id']
 
     def get_queryset(self, request):
-        source = Source.get_by_pk(request.url_params['pk'])
-        if not source:
-            raise NotFound('The requested Source is not found')
-        return Post.get_all_by_source_and_user(
-            source=source,
+        return PostInteraction.annotate(Post.get_all_by_source_and_user(
+            source=request.url_objects['source'],
             user=request.user
-        )
+        ), request.user)
+
+    def is_own_source(self, request):
+        # posts of a shared feed are read only to its subscribers, only
+        # legacy sources own their posts
+        return not request.url_objects['source'].feed_id
+
+    def has_update_permission(self, obj, request):
+        return self.is_own_source(request)
+
+    def has_delete_permission(self, obj, request):
+        return self.is_own_source(request)
 
     def create_default_params(self, request):
-        source = Source.get_by_pk(request.url_params['pk'])
-        if not source:
-            raise NotFound('The requested Source is not found')
         return {
-            'source': source
+            'source': request.url_objects['source']
         }
 
-    def additional_context_params(self, request):
-        source = Source.get_by_pk(request.url_params['pk'])
-        if not source:
-            raise NotFound('The requested Source is not found')
-        return {
-            'source': source
-        }
+    def create(self, request):
+        if not self.is_own_source(request):
+            return ErrorResponse(errors.YOU_CANNOT_CREATE_THIS_OBJECT_AT_THIS_TIME)
+        return super().create(request)
 
     def retrieve(self, request, post_id):
         return super().retrieve(request, post_id)
@@ -69,7 +105,7 @@ class PostApiView(PaginatedViewSet):
         obj = self.get_queryset(request).filter(pk=post_id).first()  # type: Post
         if not obj:
             return self.not_found(request)
-        obj.like()
+        obj.like(request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def dislike(self, request, post_id):
@@ -77,8 +113,56 @@ class PostApiView(PaginatedViewSet):
         if not obj:
             return self.not_found(request)
 
-        if not self.has_delete_permission(obj, request):
-            return self.no_delete_permission(request)
+        obj.unlike(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def read(self, request, post_id):
+        return self.mark_read(request, post_id, True)
 
-        obj.unlike()
+    def unread(self, request, post_id):
+        return self.mark_read(request, post_id, False)
+
+    def mark_read(self, request, post_id, read):
+        if not self.get_queryset(request).filter(pk=post_id).exists():
+            return self.not_found(request)
+        ReadState.mark(request.url_objects['source'], [int(post_id)], read)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TimelineApiView(PaginatedViewSet):
+    serializer_class = PostSerializer
+
+    authentication_classes = (CustomTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    async_actions = ('list',)
+    pagination_mode = PaginatedViewSet.PAGINATION_MODE_CURSOR
+    cursor_ordering = ['-created', '-id']
+
+    def get_cursor_ordering(self, request):
+        if request.user.materialized_timeline:
+            return ['-timeline_created', '-timeline_post_id']
+        return self.cursor_ordering
+
+    def get_queryset(self, request):
+        if request.user.materialized_timeline:
+            query_set = TimelineEntry.get_timeline(request.user)
+        else:
+            query_set = Post.get_timeline(request.user)
+        return PostInteraction.annotate(query_set, request.user)
+
+
+class InteractionBatchApiView(BaseApiView):
+    authentication_classes = (CustomTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = InteractionBatchSerializer(data=request.data,
+                                                context={'user': request.user})
+
+        if not serializer.is_valid():
+            return ErrorResponse(errors.USER_DATA_INPUT_IS_NOT_VALID,
+                                 errors=serializer.errors)
+
+        skipped = serializer.save()
+
+        return Response(data={'skipped': skipped})
@@ -55,3 +55,27 @@ JWT_AUTH = {
     'JWT_AUTH_HEADER_PREFIX': 'Bearer',
     'JWT_AUTH_COOKIE': None,
 }
+
+# Token value -> user snapshot cache used by CustomTokenAuthentication
+TOKEN_CACHE = {
+    'MAX_SIZE': 10000,
+    'TIMEOUT': 300,
+    # alias of a Django cache shared by all workers, None keeps it in process
+    'SHARED_CACHE': None,
+    # with a shared cache, how long a worker trusts its own copy
+    'SHARED_LOCAL_TIMEOUT': 5,
+}
+
+TOKEN_AUTH = {
+    # 'database' checks every token against JwtToken (through TOKEN_CACHE),
+    # 'stateless' trusts signed tokens until they expire and only checks
+    # them against the in-memory denylist of revoked tokens
+    'MODE': 'database',
+    'DENYLIST_REFRESH_INTERVAL': 30,
+    # seconds of revocations read again on every refresh, covers the time
+    # between a revocation being written and committed
+    'DENYLIST_OVERLAP': 120,
+    # cache holding the revocation version, share it between workers so a
+    # logout is seen everywhere before the next refresh interval
+    'DENYLIST_CACHE': 'default',
+}
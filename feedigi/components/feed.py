@@ -0,0 +1,70 @@
+# Feed poller
+# Workers only do network I/O and parsing, all database writes happen in
+# the polling process in bulk once per batch.
+
+FEED_POLLER = {
+    'BATCH_SIZE': 500,
+    'WORKERS': 32,
+    'TIMEOUT': 20,
+    'IDLE_SLEEP': 5,
+    'USER_AGENT': 'Feedigi/1.0 (+https://github.com/Mazafard/feedigi)',
+    # politeness towards hosts serving many feeds, delay is in seconds
+    'HOST_CONCURRENCY': 2,
+    'HOST_DELAY': 0.5,
+    'HOST_BATCH_LIMIT': 20,
+    # keep-alive sessions kept open
+    'MAX_HOSTS': 1000,
+    'MAX_REDIRECTS': 5,
+    # seconds a temporary redirect has to persist before the feed url is
+    # rewritten like for a permanent one
+    'PROMOTE_REDIRECT_AFTER': 7 * 24 * 60 * 60,
+}
+
+# Adaptive polling interval bounds, in seconds
+FEED_SCHEDULER = {
+    'MIN_INTERVAL': 300,
+    'MAX_INTERVAL': 24 * 60 * 60,
+    'GROWTH_FACTOR': 1.2,
+    'BACKOFF_FACTOR': 2,
+    'STALE_AFTER': 7 * 24 * 60 * 60,
+}
+
+# Materialized timelines of users with `materialized_timeline` set, new posts
+# are copied to every subscriber on ingest and the trim_timelines command
+# keeps only the newest
+FEED_TIMELINE = {
+    'MAX_LENGTH': 1000,
+}
+
+# Read state of subscriptions, see feed.models.ReadState
+FEED_READ_STATE = {
+    'MAX_EXCEPTIONS': 1000,
+}
+
+# Limits of the streaming feed parser, bodies are in characters
+FEED_PARSER = {
+    'CHUNK_SIZE': 64 * 1024,
+    'MAX_ENTRIES': 500,
+    'MAX_BODY_SIZE': 256 * 1024,
+    'MAX_BYTES': 20 * 1024 * 1024,
+}
+
+# Proxy rotation for sources that block direct fetches, see
+# feed.proxies.ProxyPool. Times are in seconds.
+FEED_PROXIES = {
+    'TIMEOUT': 10,
+    'EWMA_ALPHA': 0.3,
+    'MAX_LATENCY': 5.0,
+    'MAX_ERROR_RATE': 0.5,
+    'EVICT_FOR': 60 * 60,
+    # requests go to a random one of this many fastest proxies
+    'CHOICES': 3,
+    # sources refused directly are tried directly again after this long
+    'PROBE_AFTER': 24 * 60 * 60,
+}
+
+# Journal of every poll, see feed.models.FetchLog
+FEED_FETCH_LOG = {
+    # days kept by the prune_fetch_log command
+    'RETENTION_DAYS': 30,
+}
@@ -1 +1,5 @@
-WSGI_APPLICATION = 'feedigi.wsgi.application'
\ No newline at end of file
+WSGI_APPLICATION = 'feedigi.wsgi.application'
+
+# Threads of an ASGI worker running the viewset actions listed in their
+# `async_actions`, each may hold its own database connection
+ASGI_VIEW_THREADS = 32
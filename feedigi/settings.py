@@ -24,5 +24,6 @@ include(
     'components/static_file.py',
     'components/cors.py',
     'components/environments.py',
+    'components/feed.py',
     scope=globals()
 )